@@ -1,7 +1,10 @@
+import threading
 from enum import Enum
 from dataclasses import dataclass
+from folder_cache import UnreadSummary
 from tile_visualizer import TileVisualizer, SimpleVisualizer, ExtraInfoVisualizer, AnimatedExtraInfoVisualizer
 from streamdeck_sdk import logger
+from unread_index import UnreadFilter
 
 
 class ExtraInfoStates(str, Enum):
@@ -11,84 +14,166 @@ class ExtraInfoStates(str, Enum):
     BOTH = "Both"
 
 
-@dataclass(init=False)
-class ContextData:
+@dataclass(frozen=True, slots=True)
+class ContextConfig:
+    """Settings of a key. Immutable, a settings change publishes a new instance in the ContextRegistry."""
+
     account: str
     extra_info: ExtraInfoStates = ExtraInfoStates.NONE
     animated: bool = False
+    folders: tuple[str, ...] = ()
+    unread_filter: UnreadFilter = UnreadFilter()
+    # Stream Deck device showing the key, empty if unknown
+    device: str = ""
+
+    def __post_init__(self):
+        if not isinstance(self.account, str) or not self.account:
+            raise ValueError("Account must be a non-empty string")
+        if not isinstance(self.extra_info, ExtraInfoStates):
+            raise ValueError("Extra info must be an instance of ExtraInfoStates")
+        if not isinstance(self.animated, bool):
+            raise ValueError("Animated must be a boolean")
+        if not isinstance(self.folders, tuple):
+            raise ValueError("Folders must be a tuple")
+        if not isinstance(self.unread_filter, UnreadFilter):
+            raise ValueError("Unread filter must be an instance of UnreadFilter")
+        if not isinstance(self.device, str):
+            raise ValueError("Device must be a string")
+
+    @staticmethod
+    def parse_extra_info(extra_info: ExtraInfoStates | str | None) -> ExtraInfoStates:
+        if extra_info is None or extra_info == "":
+            return ExtraInfoStates.NONE
+        if not isinstance(extra_info, ExtraInfoStates):
+            extra_info = ExtraInfoStates(extra_info)
+        return extra_info
+
+    @staticmethod
+    def parse_animated(animated: bool | str) -> bool:
+        if isinstance(animated, str) and animated.lower() == "false":
+            animated = False
+        return bool(animated)
+
+
+@dataclass(init=False, slots=True)
+class ContextData:
+    """
+    Runtime state of a key, used by the monitoring thread.
+    The visualizer is picked for the configuration of the generation being processed.
+    """
+
+    context: str
     set_state_callback: callable
     set_title_callback: callable
-    tile_visualizer: TileVisualizer
+    # Tells whether the key is still shown, checked right before the tile is updated
+    is_visible_callback: callable
+    tile_visualizer: TileVisualizer | None
+    # Visualizers created for this context, reused when the settings switch back to them
+    visualizers: dict[type, TileVisualizer]
+    last_summary: UnreadSummary | None
+    # Title of the configuration error shown instead of the count
+    error: str | None
+    # Set when the key disappeared, a monitoring cycle still holding the data must not show anything
+    released: bool
+    # Serializes updating the tile on the monitoring thread with stopping or releasing it on other threads
+    lock: threading.Lock
 
     def __init__(
         self,
-        account: str,
-        extra_info: ExtraInfoStates,
-        animated: bool,
+        context: str,
         set_state_callback: callable,
         set_title_callback: callable,
+        is_visible_callback: callable = None,
     ):
-        self.account = account
-        self.extra_info = extra_info
-        self.animated = animated
+        self.context = context
         self.set_state_callback = set_state_callback
         self.set_title_callback = set_title_callback
+        self.is_visible_callback = is_visible_callback
         self.tile_visualizer = None
+        self.visualizers = {}
+        self.last_summary = None
+        self.error = None
+        self.released = False
+        self.lock = threading.Lock()
 
         self.__post_init__()
 
-    def _update_tile_visualizer(self):
-        if self.tile_visualizer is not None:
-            self.tile_visualizer.stop()
+    def __post_init__(self):
+        if not isinstance(self.context, str) or not self.context:
+            raise ValueError("Context must be a non-empty string")
+        if not callable(self.set_state_callback):
+            raise ValueError("Set state callback must be a callable")
+        if not callable(self.set_title_callback):
+            raise ValueError("Set title callback must be a callable")
+        if self.is_visible_callback is not None and not callable(self.is_visible_callback):
+            raise ValueError("Is visible callback must be a callable")
 
-        if self.extra_info == ExtraInfoStates.NONE:
-            logger.debug(f"[{self.account}] Updating tile visualizer to SimpleVisualizer")
-            self.tile_visualizer = SimpleVisualizer(self.set_state_callback, self.set_title_callback)
+    def get_tile_visualizer(self, config: ContextConfig) -> TileVisualizer:
+        show_sender = config.extra_info in [ExtraInfoStates.SENDER, ExtraInfoStates.BOTH]
+        show_subject = config.extra_info in [ExtraInfoStates.SUBJECT, ExtraInfoStates.BOTH]
+        if config.extra_info == ExtraInfoStates.NONE:
+            visualizer_class = SimpleVisualizer
         else:
-            show_sender = self.extra_info in [ExtraInfoStates.SENDER, ExtraInfoStates.BOTH]
-            show_subject = self.extra_info in [ExtraInfoStates.SUBJECT, ExtraInfoStates.BOTH]
-            if not self.animated:
-                logger.debug(f"[{self.account}] Updating tile visualizer to ExtraInfoVisualizer")
-                self.tile_visualizer = ExtraInfoVisualizer(
-                    self.set_state_callback, self.set_title_callback, show_sender, show_subject
+            visualizer_class = AnimatedExtraInfoVisualizer if config.animated else ExtraInfoVisualizer
+
+        tile_visualizer = self.visualizers.get(visualizer_class)
+        if tile_visualizer is None:
+            if visualizer_class is SimpleVisualizer:
+                tile_visualizer = SimpleVisualizer(
+                    self.context, self.set_state_callback, self.set_title_callback
                 )
             else:
-                logger.debug(f"[{self.account}] Updating tile visualizer to AnimatedExtraInfoVisualizer")
-                self.tile_visualizer = AnimatedExtraInfoVisualizer(
-                    self.set_state_callback, self.set_title_callback, show_sender, show_subject
+                tile_visualizer = visualizer_class(
+                    self.context, self.set_state_callback, self.set_title_callback, show_sender, show_subject
                 )
+            self.visualizers[visualizer_class] = tile_visualizer
+        elif visualizer_class is not SimpleVisualizer:
+            tile_visualizer.configure(show_sender, show_subject)
 
-    def __post_init__(self):
-        if not isinstance(self.account, str) or not self.account:
-            raise ValueError("Account must be a non-empty string")
-        if not isinstance(self.extra_info, ExtraInfoStates):
-            raise ValueError("Extra info must be an instance of ExtraInfoStates")
-        if not isinstance(self.animated, bool):
-            raise ValueError("Animated must be a boolean")
-        if not callable(self.set_state_callback):
-            raise ValueError("Set state callback must be a callable")
-        if not callable(self.set_title_callback):
-            raise ValueError("Set title callback must be a callable")
-        self._update_tile_visualizer()
+        if tile_visualizer is not self.tile_visualizer:
+            logger.debug(f"[{config.account}] Updating tile visualizer to {visualizer_class.__name__}")
+            self._stop_tile_visualizer()
+            self.tile_visualizer = tile_visualizer
+        return tile_visualizer
 
-    def set_extra_info(self, extra_info: ExtraInfoStates | str):
-        if extra_info is None or extra_info == "":
-            extra_info = ExtraInfoStates.NONE
-        if not isinstance(extra_info, ExtraInfoStates):
-            extra_info = ExtraInfoStates(extra_info)
-        if self.extra_info == extra_info:
-            return
-        self.extra_info = extra_info
-        self._update_tile_visualizer()
+    def stop(self):
+        with self.lock:
+            self._stop_tile_visualizer()
 
-    def set_animated(self, animated: bool | str):
-        logger.debug(f"[{self.account}] Received animated: {animated}")
-        if isinstance(animated, str) and animated.lower() == "false":
-            animated = False
+    def _stop_tile_visualizer(self):
+        if self.tile_visualizer is not None:
+            self.tile_visualizer.stop()
+
+    def _is_hidden(self) -> bool:
+        return self.released or (
+            self.is_visible_callback is not None and not self.is_visible_callback(self.context)
+        )
+
+    def show_summary(self, config: ContextConfig, summary: UnreadSummary):
+        with self.lock:
+            # Checked under the lock, so a key stopped because it was hidden is not started again
+            if self._is_hidden():
+                return
+            self.error = None
+            self.last_summary = summary
+            self.get_tile_visualizer(config).update_tile(summary)
+
+    def show_error(self, title: str):
+        with self.lock:
+            if self._is_hidden() or title == self.error:
+                return
+            # The visualizer sends the whole tile again once the error is gone
+            self._stop_tile_visualizer()
+            self.error = title
+            self.last_summary = None
+            self.set_title_callback(context=self.context, title=title)
 
-        animated = bool(animated)
-        if self.animated == animated:
-            return
-        logger.debug(f"[{self.account}] Setting animated to {animated}")
-        self.animated = animated
-        self._update_tile_visualizer()
+    def release(self):
+        """Stops the running animations, called when the key disappears."""
+        with self.lock:
+            self.released = True
+            for visualizer in self.visualizers.values():
+                visualizer.stop()
+            self.visualizers.clear()
+            self.tile_visualizer = None
+            self.last_summary = None
@@ -0,0 +1,99 @@
+import dataclasses
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from context_data import ContextConfig
+
+
+@dataclass(frozen=True, slots=True)
+class ContextGeneration:
+    number: int
+    configs: Mapping[str, ContextConfig]
+    # Devices reported as disconnected, their keys are not shown anywhere
+    disconnected_devices: frozenset[str] = frozenset()
+
+    def get_visible_configs(self) -> list[tuple[str, ContextConfig]]:
+        """Configurations of the keys which are shown on a connected device."""
+        return [
+            (context, config)
+            for context, config in self.configs.items()
+            if config.device not in self.disconnected_devices
+        ]
+
+
+class ContextRegistry:
+    """
+    Copy-on-write registry of the key configurations and of the device connection state.
+    Only the keys which are currently shown are registered, they are removed when they disappear.
+    Writers build the next generation under a lock and publish it with a single assignment, so readers
+    take the current generation without locking and always see all contexts in a consistent state.
+    """
+
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        self.generation = ContextGeneration(number=0, configs=MappingProxyType({}))
+
+    def get(self, context: str) -> ContextConfig | None:
+        return self.generation.configs.get(context)
+
+    def is_visible(self, context: str) -> bool:
+        """Whether the key is registered and its device is connected."""
+        generation = self.generation
+        config = generation.configs.get(context)
+        return config is not None and config.device not in generation.disconnected_devices
+
+    def set(self, context: str, config: ContextConfig) -> None:
+        with self._write_lock:
+            configs = dict(self.generation.configs)
+            configs[context] = config
+            self._publish(configs)
+
+    def update(self, context: str, **changes) -> ContextConfig | None:
+        """
+        Publishes the context's configuration with the given fields replaced.
+        Unknown contexts are ignored.
+        """
+        with self._write_lock:
+            config = self.generation.configs.get(context)
+            if config is None:
+                return None
+            new_config = dataclasses.replace(config, **changes)
+            if new_config != config:
+                configs = dict(self.generation.configs)
+                configs[context] = new_config
+                self._publish(configs)
+            return new_config
+
+    def remove(self, context: str) -> None:
+        with self._write_lock:
+            if context not in self.generation.configs:
+                return
+            configs = dict(self.generation.configs)
+            del configs[context]
+            self._publish(configs)
+
+    def set_device_connected(self, device: str, connected: bool) -> bool:
+        """Returns whether the connection state of the device changed."""
+        with self._write_lock:
+            disconnected_devices = self.generation.disconnected_devices
+            if connected == (device not in disconnected_devices):
+                return False
+            if connected:
+                disconnected_devices = disconnected_devices - {device}
+            else:
+                disconnected_devices = disconnected_devices | {device}
+            self._publish(dict(self.generation.configs), disconnected_devices)
+            return True
+
+    def _publish(
+        self, configs: dict[str, ContextConfig], disconnected_devices: frozenset[str] | None = None
+    ) -> None:
+        if disconnected_devices is None:
+            disconnected_devices = self.generation.disconnected_devices
+        self.generation = ContextGeneration(
+            number=self.generation.number + 1,
+            configs=MappingProxyType(configs),
+            disconnected_devices=disconnected_devices,
+        )
@@ -0,0 +1,168 @@
+import json
+import queue
+import socket
+import socketserver
+import threading
+
+from streamdeck_sdk import logger
+
+COUNT_SERVICE_HOST = "127.0.0.1"
+DEFAULT_COUNT_SERVICE_PORT = 47201
+MAX_PENDING_MESSAGES = 100
+
+
+class CountServiceSubscriber:
+    """
+    A connected client. An empty set of accounts means all accounts.
+    Messages are written by the subscriber's own thread, so a slow client never blocks the monitoring.
+    """
+
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.accounts: set[str] = set()
+        self.messages: queue.Queue = queue.Queue(maxsize=MAX_PENDING_MESSAGES)
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def wants(self, account: str) -> bool:
+        return not self.accounts or account in self.accounts
+
+    def send(self, snapshots: list[dict]) -> None:
+        data = "".join(json.dumps(snapshot) + "\n" for snapshot in snapshots).encode("utf-8")
+        self.messages.put_nowait(data)
+
+    def close(self) -> None:
+        try:
+            self.messages.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _write(self) -> None:
+        while True:
+            data = self.messages.get()
+            if data is None:
+                return
+            try:
+                self.connection.sendall(data)
+            except OSError:
+                return
+
+
+class CountServiceHandler(socketserver.StreamRequestHandler):
+    """
+    Reads subscription requests of a client, one JSON object per line, e.g. {"subscribe": ["account"]}.
+    Snapshots are pushed to the client by CountService.publish.
+    """
+
+    def handle(self):
+        service: CountService = self.server.count_service
+        subscriber = CountServiceSubscriber(self.connection)
+        service.add_subscriber(subscriber)
+        try:
+            while True:
+                try:
+                    line = self.rfile.readline()
+                except OSError:
+                    return
+                if not line:
+                    return
+                try:
+                    request = json.loads(line)
+                    accounts = request.get("subscribe", [])
+                    if not isinstance(accounts, list) or not all(isinstance(acc, str) for acc in accounts):
+                        raise ValueError("subscribe must be a list of account names")
+                except (ValueError, AttributeError):
+                    logger.warning(f"Count service: invalid request {line!r}")
+                    continue
+                service.subscribe(subscriber, set(accounts))
+        finally:
+            service.remove_subscriber(subscriber)
+            subscriber.close()
+
+
+class CountServiceServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class CountService:
+    """
+    Shares the unread counts over a local socket, so other tools don't have to poll Outlook themselves.
+    Clients receive the current snapshot of every subscribed account after connecting and then every
+    changed snapshot, one JSON object per line.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+        self.server: CountServiceServer | None = None
+        self.snapshots: dict[str, dict] = {}
+        self.subscribers: set[CountServiceSubscriber] = set()
+        # Called when a client connects or changes its subscription, e.g. to resume the monitoring
+        self.on_subscribe: callable | None = None
+        # Reentrant, because a failed send removes the subscriber while the lock is held
+        self.lock = threading.RLock()
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self.subscribers)
+
+    def start(self) -> None:
+        self.server = CountServiceServer((COUNT_SERVICE_HOST, self.port), CountServiceHandler)
+        self.server.count_service = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Count service listening on {COUNT_SERVICE_HOST}:{self.port}")
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def add_subscriber(self, subscriber: CountServiceSubscriber) -> None:
+        with self.lock:
+            self.subscribers.add(subscriber)
+            self._send(subscriber, list(self.snapshots.values()))
+        self._notify_subscribe()
+
+    def remove_subscriber(self, subscriber: CountServiceSubscriber) -> None:
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers:
+                # Nothing is published without subscribers, so the next client must not get these as current
+                self.snapshots = {}
+
+    def subscribe(self, subscriber: CountServiceSubscriber, accounts: set[str]) -> None:
+        with self.lock:
+            subscriber.accounts = accounts
+            self._send(subscriber, list(self.snapshots.values()))
+        self._notify_subscribe()
+
+    def publish(self, snapshots: dict[str, dict]) -> None:
+        """Pushes the snapshots which changed since the last publish to the subscribers."""
+        with self.lock:
+            changed = [
+                snapshot for account, snapshot in snapshots.items() if self.snapshots.get(account) != snapshot
+            ]
+            self.snapshots = dict(snapshots)
+            for subscriber in list(self.subscribers):
+                self._send(subscriber, changed)
+
+    def _notify_subscribe(self) -> None:
+        if self.on_subscribe is not None:
+            self.on_subscribe()
+
+    def _send(self, subscriber: CountServiceSubscriber, snapshots: list[dict]) -> None:
+        snapshots = [snapshot for snapshot in snapshots if subscriber.wants(snapshot["account"])]
+        if not snapshots:
+            return
+        try:
+            subscriber.send(snapshots)
+        except queue.Full:
+            logger.debug("Count service: dropping a subscriber which does not read its messages")
+            self.remove_subscriber(subscriber)
+            subscriber.close()
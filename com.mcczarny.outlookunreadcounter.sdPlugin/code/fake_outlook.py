@@ -0,0 +1,286 @@
+import itertools
+import queue
+import threading
+import weakref
+from collections import Counter
+from datetime import datetime
+
+from folder_cache import CHANGE_STAMP_PROPERTY
+from outlook_backend import OutlookBackend
+from unread_index import EXCHANGE_ADDRESS_TYPE, SENDER_SMTP_ADDRESS_PROPERTY, UNREAD_TABLE_FILTER
+
+
+class FakeComError(Exception):
+    pass
+
+
+class FakePropertyAccessor:
+    def __init__(self, backend: "FakeOutlookBackend", properties: dict[str, callable]):
+        self._backend = backend
+        self._properties = properties
+
+    def GetProperty(self, name: str) -> object:
+        self._backend.calls["GetProperty"] += 1
+        if name not in self._properties:
+            raise FakeComError(f"Property {name} not found")
+        return self._properties[name]()
+
+
+class FakeMailItem:
+    """An email. Exchange senders have an X.500 distinguished name as SenderEmailAddress, like in Outlook."""
+
+    def __init__(
+        self,
+        folder: "FakeFolder",
+        entry_id: str,
+        sender: str,
+        subject: str,
+        received: datetime,
+        address: str | None = None,
+        exchange: bool = False,
+    ):
+        self._folder = folder
+        self._unread = True
+        self.EntryID = entry_id
+        self.SenderName = sender
+        self.smtp_address = address or f"{sender.lower().replace(' ', '.')}@example.com"
+        if exchange:
+            self.SenderEmailType = EXCHANGE_ADDRESS_TYPE
+            self.SenderEmailAddress = (
+                f"/O=EXCHANGELABS/OU=EXCHANGE ADMINISTRATIVE GROUP/CN=RECIPIENTS/CN={entry_id}"
+            )
+        else:
+            self.SenderEmailType = "SMTP"
+            self.SenderEmailAddress = self.smtp_address
+        self.Subject = subject
+        self.ReceivedTime = received
+        self.PropertyAccessor = FakePropertyAccessor(
+            folder.backend, {SENDER_SMTP_ADDRESS_PROPERTY: lambda: self.smtp_address}
+        )
+
+    def get_column(self, column: str) -> object:
+        if column == SENDER_SMTP_ADDRESS_PROPERTY:
+            return self.smtp_address
+        return getattr(self, column)
+
+    @property
+    def UnRead(self) -> bool:
+        return self._unread
+
+    @UnRead.setter
+    def UnRead(self, unread: bool) -> None:
+        if self._unread == unread:
+            return
+        self._unread = unread
+        self._folder.notify("OnItemChange", self)
+
+
+class FakeItems:
+    def __init__(self, folder: "FakeFolder", items: list[FakeMailItem]):
+        self._folder = folder
+        self._items = items
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def GetLast(self) -> FakeMailItem | None:
+        return self._items[-1] if self._items else None
+
+
+class FakeColumns:
+    def __init__(self):
+        self.names: list[str] = []
+
+    def RemoveAll(self) -> None:
+        self.names.clear()
+
+    def Add(self, name: str) -> None:
+        self.names.append(name)
+
+
+class FakeRow:
+    def __init__(self, values: tuple):
+        self._values = values
+
+    def GetValues(self) -> tuple:
+        return self._values
+
+    def UTCToLocalTime(self, index: int) -> object:
+        # The fake keeps the local time in the table
+        return self._values[index - 1]
+
+
+class FakeTable:
+    def __init__(self, mails: list[FakeMailItem]):
+        self._mails = mails
+        self._position = 0
+        self.Columns = FakeColumns()
+
+    @property
+    def EndOfTable(self) -> bool:
+        return self._position >= len(self._mails)
+
+    def GetNextRow(self) -> FakeRow:
+        mail = self._mails[self._position]
+        self._position += 1
+        return FakeRow(tuple(mail.get_column(column) for column in self.Columns.names))
+
+
+class FakeFolder:
+    def __init__(self, backend: "FakeOutlookBackend", store_id: str, name: str):
+        self.backend = backend
+        self.Name = name
+        self.StoreID = store_id
+        self.EntryID = backend.next_entry_id()
+        self.PropertyAccessor = FakePropertyAccessor(
+            backend, {CHANGE_STAMP_PROPERTY: lambda: self.change_stamp}
+        )
+        self.change_stamp = 0
+        self.mails: list[FakeMailItem] = []
+        self.subfolders: dict[str, FakeFolder] = {}
+        # Event sinks of forgotten folders must not be kept alive
+        self.event_sinks: weakref.WeakSet = weakref.WeakSet()
+
+    @property
+    def Items(self) -> FakeItems:
+        return FakeItems(self, self.mails)
+
+    def GetTable(self, table_filter: str) -> FakeTable:
+        self.backend.calls["GetTable"] += 1
+        if table_filter != UNREAD_TABLE_FILTER:
+            raise FakeComError(f"Unsupported filter: {table_filter}")
+        return FakeTable([mail for mail in self.mails if mail.UnRead])
+
+    @property
+    def UnReadItemCount(self) -> int:
+        self.backend.calls["UnReadItemCount"] += 1
+        return sum(1 for mail in self.mails if mail.UnRead)
+
+    def Folders(self, name: str) -> "FakeFolder":
+        if name not in self.subfolders:
+            raise FakeComError(f"Folder {name} not found")
+        return self.subfolders[name]
+
+    def add_folder(self, name: str) -> "FakeFolder":
+        if name not in self.subfolders:
+            self.subfolders[name] = FakeFolder(self.backend, self.StoreID, name)
+        return self.subfolders[name]
+
+    def notify(self, event: str, *args) -> None:
+        self.change_stamp += 1
+        for sink in list(self.event_sinks):
+            self.backend.events.put((getattr(sink, event), args))
+
+    def deliver(
+        self, sender: str, subject: str, address: str | None = None, exchange: bool = False
+    ) -> FakeMailItem:
+        mail = FakeMailItem(
+            self, self.backend.next_entry_id(), sender, subject, datetime.now(), address, exchange
+        )
+        self.mails.append(mail)
+        self.notify("OnItemAdd", mail)
+        return mail
+
+    def remove(self, mail: FakeMailItem) -> None:
+        self.mails.remove(mail)
+        self.notify("OnItemRemove")
+
+
+class FakeStore:
+    def __init__(self, backend: "FakeOutlookBackend", display_name: str):
+        self.DisplayName = display_name
+        self.StoreID = f"store-{display_name}"
+        backend.stores[self.StoreID] = self
+        self.root = FakeFolder(backend, self.StoreID, display_name)
+        self.inbox = self.root.add_folder("Inbox")
+
+    def GetRootFolder(self) -> FakeFolder:
+        return self.root
+
+    def GetDefaultFolder(self, folder_id: int) -> FakeFolder:
+        # Stores like Public Folders have no Inbox
+        if self.inbox is None:
+            raise FakeComError(f"Store {self.DisplayName} has no default folder {folder_id}")
+        return self.inbox
+
+
+class FakeStores:
+    def __init__(self, backend: "FakeOutlookBackend"):
+        self._backend = backend
+
+    def __iter__(self):
+        return iter(list(self._backend.stores.values()))
+
+    @property
+    def Count(self) -> int:
+        return len(self._backend.stores)
+
+    def __call__(self, display_name: str) -> FakeStore:
+        for store in self._backend.stores.values():
+            if store.DisplayName == display_name:
+                return store
+        raise FakeComError(f"Store {display_name} not found")
+
+
+class FakeNamespace:
+    def __init__(self, backend: "FakeOutlookBackend"):
+        self._backend = backend
+        self.Stores = FakeStores(backend)
+
+    def GetItemFromID(self, entry_id: str, store_id: str | None = None) -> FakeMailItem:
+        self._backend.calls["GetItemFromID"] += 1
+        for store in self._backend.stores.values():
+            if store_id is not None and store.StoreID != store_id:
+                continue
+            for folder in self._backend.iter_folders(store.root):
+                for mail in folder.mails:
+                    if mail.EntryID == entry_id:
+                        return mail
+        raise FakeComError(f"Item {entry_id} not found")
+
+
+class FakeOutlookBackend(OutlookBackend):
+    """
+    In-memory stand-in for Outlook, so the monitoring engine can run on systems without Outlook.
+    Item events are queued and delivered by pump_messages, like COM events on the monitoring thread.
+    The number of Outlook calls which read data is counted in calls.
+    """
+
+    com_error = FakeComError
+
+    def __init__(self, accounts: list[str] | tuple[str, ...] = ("fake@example.com",)):
+        self.stores: dict[str, FakeStore] = {}
+        self.events: queue.SimpleQueue = queue.SimpleQueue()
+        self.calls: Counter = Counter()
+        self._entry_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        for account in accounts:
+            FakeStore(self, account)
+
+    def next_entry_id(self) -> str:
+        with self._lock:
+            return f"entry-{next(self._entry_ids)}"
+
+    def iter_folders(self, folder: FakeFolder):
+        yield folder
+        for subfolder in folder.subfolders.values():
+            yield from self.iter_folders(subfolder)
+
+    def get_store(self, display_name: str) -> FakeStore:
+        return FakeStores(self)(display_name)
+
+    def get_namespace(self) -> FakeNamespace:
+        return FakeNamespace(self)
+
+    def with_events(self, items: FakeItems, events_class: type) -> object:
+        sink = events_class()
+        items._folder.event_sinks.add(sink)
+        return sink
+
+    def pump_messages(self) -> None:
+        while True:
+            try:
+                handler, args = self.events.get_nowait()
+            except queue.Empty:
+                return
+            handler(*args)
@@ -0,0 +1,247 @@
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from outlook_backend import CDispatch, OutlookBackend
+from streamdeck_sdk import logger
+from unread_index import UnreadFilter, UnreadIndex
+
+INBOX_FOLDER_ID = 6  # olFolderInbox
+# PR_LOCAL_COMMIT_TIME_MAX changes whenever anything in the folder is modified.
+CHANGE_STAMP_PROPERTY = "http://schemas.microsoft.com/mapi/proptag/0x670A0040"
+STORE_PATH_PREFIX = "\\\\"
+FOLDER_PATH_SEPARATORS_REGEX = re.compile(r"[\\/]+")
+FOLDER_LIST_SEPARATORS_REGEX = re.compile(r"[\n;]+")
+
+
+class FolderNotFoundError(Exception):
+    """The configured folder or account does not exist, while Outlook itself is reachable."""
+
+
+def parse_folder_paths(text: str | list | tuple | None) -> tuple[str, ...]:
+    """
+    Parses the folders setting into a tuple of folder paths.
+    Paths are separated with new lines or semicolons, empty entries are dropped.
+    """
+    if text is None:
+        return ()
+    entries = text if isinstance(text, (list, tuple)) else FOLDER_LIST_SEPARATORS_REGEX.split(text)
+    return tuple(entry.strip() for entry in entries if entry and entry.strip())
+
+
+def resolve_folder(outlook: CDispatch, account: str, path: str) -> CDispatch:
+    """
+    Returns the Outlook folder for the given path.
+    An empty path means the Inbox of the account. Relative paths ("Inbox/Alerts") start at the root folder
+    of the account, paths starting with "\\\\" name the store first ("\\\\other@example.com\\Inbox").
+    """
+    if path.startswith(STORE_PATH_PREFIX):
+        # The store name ends at the first separator, like the folder names
+        account, *rest = FOLDER_PATH_SEPARATORS_REGEX.split(path[len(STORE_PATH_PREFIX) :], maxsplit=1)
+        path = rest[0] if rest else ""
+    store = outlook.Stores(account)
+    segments = [segment for segment in FOLDER_PATH_SEPARATORS_REGEX.split(path) if segment]
+    if not segments:
+        return store.GetDefaultFolder(INBOX_FOLDER_ID)
+
+    folder = store.GetRootFolder()
+    for segment in segments:
+        folder = folder.Folders(segment)
+    return folder
+
+
+@dataclass
+class UnreadSummary:
+    unread_count: int = 0
+    sender: str | None = None
+    subject: str | None = None
+    received: datetime | None = None
+    entry_id: str | None = None
+    store_id: str | None = None
+
+    @property
+    def has_details(self) -> bool:
+        return self.sender is not None and self.subject is not None
+
+
+class FolderItemsEvents:
+    """
+    Outlook Items events sink. Events are delivered only while the monitoring thread pumps COM messages.
+    """
+
+    watched_folder = None
+
+    def OnItemAdd(self, item):
+        self.watched_folder.on_item_changed(item)
+
+    def OnItemChange(self, item):
+        self.watched_folder.on_item_changed(item)
+
+    def OnItemRemove(self):
+        self.watched_folder.on_item_removed()
+
+
+@dataclass
+class WatchedFolder:
+    folder: CDispatch
+    # The Items collection has to stay referenced, otherwise Outlook stops sending its events.
+    items: CDispatch
+    events: FolderItemsEvents | None
+    store_id: str
+    index: UnreadIndex = field(default_factory=UnreadIndex)
+    change_stamp: object = None
+    needs_seed: bool = True
+    removal_pending: bool = False
+    last_checked: float = 0.0
+
+    def on_item_changed(self, item: CDispatch) -> None:
+        if self.needs_seed:
+            return
+        try:
+            self.index.update(item)
+        except Exception as err:
+            logger.warning(f"Failed to index changed item, reseeding the folder: {err}")
+            self.needs_seed = True
+
+    def on_item_removed(self) -> None:
+        # Outlook does not tell which item was removed, the count check tells if the index is affected.
+        self.removal_pending = True
+
+
+class FolderCache:
+    """
+    Keeps an index of unread items per folder, so counting does not need any Outlook calls.
+    The index is seeded once and then updated from the folder notifications. As a fallback for missed
+    notifications, the folder's change stamp is checked periodically and the index is verified when it moved.
+    Must be used only from the thread that owns the Outlook namespace.
+    """
+
+    CHANGE_STAMP_CHECK_INTERVAL: float = 60
+
+    def __init__(self, backend: OutlookBackend):
+        self.backend = backend
+        # Keyed by the StoreID and EntryID, so every folder is watched once however its path is written
+        self.folders: dict[tuple[str, str], WatchedFolder] = {}
+        # Configured (account, path) keys resolved to the folder keys
+        self.paths: dict[tuple[str, str], tuple[str, str]] = {}
+
+    def clear(self) -> None:
+        self.folders.clear()
+        self.paths.clear()
+
+    def invalidate(self) -> None:
+        for watched_folder in self.folders.values():
+            watched_folder.needs_seed = True
+
+    def prune(self, keys: set[tuple[str, str]]) -> None:
+        """Forgets the folders which are no longer watched by any tile."""
+        for key in list(self.paths.keys()):
+            if key not in keys:
+                logger.debug(f"Folder {key} is no longer watched")
+                del self.paths[key]
+        folder_keys = set(self.paths.values())
+        for folder_key in list(self.folders.keys()):
+            if folder_key not in folder_keys:
+                del self.folders[folder_key]
+
+    @staticmethod
+    def get_keys(account: str, paths: tuple[str, ...]) -> list[tuple[str, str]]:
+        return [(account, path) for path in paths] if paths else [(account, "")]
+
+    def get_summary(
+        self,
+        outlook: CDispatch,
+        account: str,
+        paths: tuple[str, ...],
+        unread_filter: UnreadFilter,
+    ) -> UnreadSummary:
+        """Returns the count of matching unread items over the given folders with the newest of them."""
+        total = UnreadSummary()
+        # Paths naming the same folder are counted once
+        folder_keys = dict.fromkeys(
+            self._get_folder_key(outlook, key) for key in self.get_keys(account, paths)
+        )
+        for folder_key in folder_keys:
+            watched_folder = self._refresh(self.folders[folder_key])
+            total.unread_count += watched_folder.index.count(unread_filter)
+            newest_item = watched_folder.index.newest(unread_filter)
+            if newest_item is not None and (total.received is None or newest_item.received > total.received):
+                total.sender = newest_item.sender
+                total.subject = newest_item.subject
+                total.received = newest_item.received
+                total.entry_id = newest_item.entry_id
+                total.store_id = watched_folder.store_id
+        return total
+
+    def _get_folder_key(self, outlook: CDispatch, key: tuple[str, str]) -> tuple[str, str]:
+        folder_key = self.paths.get(key)
+        if folder_key is not None:
+            return folder_key
+
+        account, path = key
+        try:
+            folder = resolve_folder(outlook, account, path)
+        except self.backend.com_error as err:
+            # A broken connection fails the same way, so make sure Outlook still answers
+            outlook.Stores.Count
+            raise FolderNotFoundError(f"Folder '{path or 'Inbox'}' of {account} not found") from err
+        folder_key = (folder.StoreID, folder.EntryID)
+        if folder_key not in self.folders:
+            self.folders[folder_key] = self._watch(folder, key)
+        self.paths[key] = folder_key
+        return folder_key
+
+    def _watch(self, folder: CDispatch, key: tuple[str, str]) -> WatchedFolder:
+        items = folder.Items
+        try:
+            events = self.backend.with_events(items, FolderItemsEvents)
+        except Exception as err:
+            logger.warning(f"Folder {key} change notifications are unavailable: {err}")
+            events = None
+        watched_folder = WatchedFolder(folder=folder, items=items, events=events, store_id=folder.StoreID)
+        if events is not None:
+            events.watched_folder = watched_folder
+        logger.debug(f"Watching folder {key}")
+        return watched_folder
+
+    def _read_change_stamp(self, watched_folder: WatchedFolder) -> object:
+        try:
+            return watched_folder.folder.PropertyAccessor.GetProperty(CHANGE_STAMP_PROPERTY)
+        except Exception:
+            # Not every store exposes the property, the index is verified on every check then.
+            return None
+
+    def _refresh(self, watched_folder: WatchedFolder) -> WatchedFolder:
+        if not watched_folder.needs_seed:
+            self._check_folder(watched_folder)
+        if watched_folder.needs_seed:
+            self._seed(watched_folder)
+        return watched_folder
+
+    def _check_folder(self, watched_folder: WatchedFolder) -> None:
+        verify = watched_folder.removal_pending
+        now = time.monotonic()
+        # Without notifications the change stamp is the only way to notice changes, so check it every time.
+        check_interval = self.CHANGE_STAMP_CHECK_INTERVAL if watched_folder.events is not None else 0
+        if now - watched_folder.last_checked >= check_interval:
+            change_stamp = self._read_change_stamp(watched_folder)
+            if change_stamp is None or change_stamp != watched_folder.change_stamp:
+                if watched_folder.events is None:
+                    watched_folder.needs_seed = True
+                    return
+                verify = True
+            watched_folder.change_stamp = change_stamp
+            watched_folder.last_checked = now
+
+        if verify:
+            watched_folder.removal_pending = False
+            if watched_folder.folder.UnReadItemCount != len(watched_folder.index):
+                watched_folder.needs_seed = True
+
+    def _seed(self, watched_folder: WatchedFolder) -> None:
+        watched_folder.needs_seed = False
+        watched_folder.removal_pending = False
+        watched_folder.change_stamp = self._read_change_stamp(watched_folder)
+        watched_folder.last_checked = time.monotonic()
+        watched_folder.index.seed(watched_folder.folder)
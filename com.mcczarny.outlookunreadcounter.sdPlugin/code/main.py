@@ -1,12 +1,22 @@
 import settings
+import argparse
+import logging
+import sys
 import threading
 import time
 
 from streamdeck_sdk import StreamDeck, Action, events_received_objs, logger, log_errors, in_separate_thread
-import win32com.client
-from context_data import ExtraInfoStates, ContextData
+from context_data import ExtraInfoStates, ContextConfig, ContextData
+from context_registry import ContextRegistry
+from count_service import CountService, DEFAULT_COUNT_SERVICE_PORT
+from fake_outlook import FakeOutlookBackend
+from folder_cache import FolderCache, FolderNotFoundError, UnreadSummary, parse_folder_paths
+from outlook_backend import OutlookBackend, ComOutlookBackend
+from unread_index import UnreadFilter
 from mail_states import MailStates
 
+HEADLESS_ARGUMENT = "--headless"
+
 
 class UnreadCounter(Action):
     UUID = "com.mcczarny.outlookunreadcounter.unreadcounter"
@@ -17,16 +27,33 @@ class UnreadCounter(Action):
     EXTRA_INFO_KEY = "extra_info"
     EXTRA_INFO_STATES_KEY = "extra_info_states"
     ANIMATE_EXTRA_INFO_KEY = "animate_extra_info"
+    FOLDERS_KEY = "folders"
+    FILTER_SENDERS_KEY = "filter_senders"
+    FILTER_SUBJECT_KEY = "filter_subject"
+    FOLDER_NOT_FOUND_TITLE = "Folder\nnot found"
 
     wake_event = threading.Event()
+    resync_event = threading.Event()  # Set when folder changes may have been missed, e.g. during sleep
 
-    outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
     monitor_outlook = None
     context = ""
-    context_data: dict[str, ContextData] = {}  # Will store ContextData objects
+    context_data: dict[str, ContextData] = {}  # Runtime state of the keys, settings are in the registry
     key_press_times: dict[str, int] = {} # Track when keys were pressed
 
-    def set_accounts_settings(self, context: str, settings: dict):
+    def __init__(self, backend: OutlookBackend | None = None, count_service: CountService | None = None):
+        super().__init__()
+        self.backend = backend if backend is not None else ComOutlookBackend()
+        self.count_service = count_service
+        self.outlook = self.backend.get_namespace()
+        self.folder_cache = FolderCache(self.backend)  # Used only by the monitoring thread
+        self.registry = ContextRegistry()
+        # Stores like Public Folders or Online Archive have no Inbox to publish, used by the monitoring only
+        self.stores_without_inbox: set[str] = set()
+        if self.count_service is not None:
+            # The monitoring is idle while nothing is shown and nobody is subscribed
+            self.count_service.on_subscribe = self.wake_event.set
+
+    def set_accounts_settings(self, context: str, settings: dict, device: str = ""):
         logger.debug(f"[{context}] set_accounts_settings: {settings}")
         accounts = [acc.DisplayName for acc in self.outlook.Stores]
 
@@ -42,29 +69,35 @@ class UnreadCounter(Action):
         else:
             current_extra_info = ExtraInfoStates(current_extra_info)
 
-        current_animated = settings.get(self.ANIMATE_EXTRA_INFO_KEY, False)
-
+        config = ContextConfig(
+            account=current_account,
+            extra_info=current_extra_info,
+            animated=ContextConfig.parse_animated(settings.get(self.ANIMATE_EXTRA_INFO_KEY, False)),
+            folders=parse_folder_paths(settings.get(self.FOLDERS_KEY)),
+            unread_filter=UnreadFilter.from_settings(
+                settings.get(self.FILTER_SENDERS_KEY), settings.get(self.FILTER_SUBJECT_KEY)
+            ),
+            device=device,
+        )
         if context not in self.context_data:
-            set_state_callback = lambda state: self.set_state(context=context, state=state)
-            set_title_callback = lambda title: self.set_title(context=context, title=title)
-
             self.context_data[context] = ContextData(
-                account=current_account,
-                extra_info=current_extra_info,
-                animated=current_animated,
-                set_state_callback=set_state_callback,
-                set_title_callback=set_title_callback,
+                context=context,
+                set_state_callback=self.set_state,
+                set_title_callback=self.set_title,
+                is_visible_callback=self.registry.is_visible,
             )
-        else:
-            self.context_data[context].account = current_account
-            self.context_data[context].extra_info = current_extra_info
+        # The monitoring picks the configuration up with the next generation
+        self.registry.set(context, config)
 
         payload = {
-            self.ACCOUNT_KEY: self.context_data[context].account,
+            self.ACCOUNT_KEY: config.account,
             self.ACCOUNTS_KEY: accounts,
-            self.EXTRA_INFO_KEY: self.context_data[context].extra_info,
+            self.EXTRA_INFO_KEY: config.extra_info,
             self.EXTRA_INFO_STATES_KEY: [state.value for state in ExtraInfoStates],
-            self.ANIMATE_EXTRA_INFO_KEY: self.context_data[context].animated,
+            self.ANIMATE_EXTRA_INFO_KEY: config.animated,
+            self.FOLDERS_KEY: "\n".join(config.folders),
+            self.FILTER_SENDERS_KEY: settings.get(self.FILTER_SENDERS_KEY, ""),
+            self.FILTER_SUBJECT_KEY: settings.get(self.FILTER_SUBJECT_KEY, ""),
         }
         self.set_settings(context=context, payload=payload)
         self.wake_event.set()
@@ -74,50 +107,148 @@ class UnreadCounter(Action):
         logger.debug(f"on_will_appear: {obj.context}")
         self.set_title(context=obj.context, title="Loading...")
         self.set_state(context=obj.context, state=MailStates.UNREAD)
+        data = self.context_data.get(obj.context)
+        if data is not None:
+            # The tile was overwritten, so the next update is sent in full
+            data.stop()
 
-        self.set_accounts_settings(obj.context, obj.payload.settings)
+        self.set_accounts_settings(obj.context, obj.payload.settings, obj.device)
 
-    def update_unread_count(self, outlook, context: str):
-        data = self.context_data[context]
-        logger.debug(f"update_unread_count: {context} account: {data.account}")
-        if not data.account:
-            logger.debug(f"No account set, skipping...")
+    @log_errors
+    def on_will_disappear(self, obj: events_received_objs.WillDisappear):
+        logger.debug(f"on_will_disappear: {obj.context}")
+        self.registry.remove(obj.context)
+        self.key_press_times.pop(obj.context, None)
+        data = self.context_data.pop(obj.context, None)
+        if data is not None:
+            data.release()
+        # Let the monitoring release the folders which are not shown anymore
+        self.wake_event.set()
+
+    @log_errors
+    def on_device_did_connect(self, obj: events_received_objs.DeviceDidConnect):
+        logger.debug(f"on_device_did_connect: {obj.device}")
+        if self.registry.set_device_connected(obj.device, True):
+            self.stop_device_tiles(obj.device)
+            self.wake_event.set()
+
+    @log_errors
+    def on_device_did_disconnect(self, obj: events_received_objs.DeviceDidDisconnect):
+        logger.debug(f"on_device_did_disconnect: {obj.device}")
+        if self.registry.set_device_connected(obj.device, False):
+            self.stop_device_tiles(obj.device)
+            self.wake_event.set()
+
+    @log_errors
+    def on_system_did_wake_up(self, obj: events_received_objs.SystemDidWakeUp):
+        logger.debug("on_system_did_wake_up")
+        # Outlook may have synchronized without sending events, so the folders are read again
+        self.resync_event.set()
+        for data in list(self.context_data.values()):
+            data.stop()
+        self.wake_event.set()
+
+    def stop_device_tiles(self, device: str):
+        """Stops the animations of the device's keys, the next update is sent in full."""
+        for context, config in self.registry.generation.configs.items():
+            data = self.context_data.get(context)
+            if config.device == device and data is not None:
+                data.stop()
+
+    def has_work(self) -> bool:
+        """Whether a key is shown on a connected device or a client is subscribed to the count service."""
+        if self.count_service is not None and self.count_service.has_subscribers:
+            return True
+        return bool(self.registry.generation.get_visible_configs())
+
+    def update_unread_count(self, outlook, context: str, config: ContextConfig):
+        data = self.context_data.get(context)
+        if data is None:
+            # The key disappeared in the meantime
+            return
+        logger.debug(f"update_unread_count: {context} account: {config.account}")
+        try:
+            summary = self.folder_cache.get_summary(
+                outlook, config.account, config.folders, config.unread_filter
+            )
+        except FolderNotFoundError as err:
+            # A configuration error of this key only, the other keys keep their cached folders
+            if data.error is None:
+                logger.warning(f"[{context}] {err}")
+            data.show_error(self.FOLDER_NOT_FOUND_TITLE)
             return
-        folder = (
-            outlook.Stores(data.account).GetDefaultFolder(6) if data.account else outlook.GetDefaultFolder(6)
-        )
 
-        logger.debug(f"account: {data.account}")
-        self.context_data[context].tile_visualizer.update_tile(folder)
+        logger.debug(f"account: {config.account} folders: {config.folders}")
+        data.show_summary(config, summary)
 
     def mark_email_as_read(self, outlook, context: str):
         data = self.context_data[context]
-        if not data.account:
-            return
-        folder = outlook.Stores(data.account).GetDefaultFolder(6) if data.account else outlook.GetDefaultFolder(6)
-        last_unread_email = folder.Items.Restrict("[UnRead] = True").GetLast()
-        if last_unread_email:
+        # Mark the newest unread email shown on the tile
+        summary = data.last_summary
+        if summary is not None and summary.entry_id is not None:
+            last_unread_email = outlook.GetItemFromID(summary.entry_id, summary.store_id)
             last_unread_email.UnRead = False
         self.wake_event.set()  # Trigger an update
 
+    def publish_snapshots(self, outlook, watched_folders: set[tuple[str, str]]):
+        """Publishes the Inbox summary of every account to the count service."""
+        snapshots = {}
+        for store in outlook.Stores:
+            account = store.DisplayName
+            if account in self.stores_without_inbox:
+                continue
+            try:
+                summary = self.folder_cache.get_summary(outlook, account, (), UnreadFilter())
+            except FolderNotFoundError:
+                logger.debug(f"publish_snapshots: {account} has no Inbox, skipping it")
+                self.stores_without_inbox.add(account)
+                continue
+            watched_folders.update(FolderCache.get_keys(account, ()))
+            snapshots[account] = self.get_snapshot(account, summary)
+        self.count_service.publish(snapshots)
+
+    @staticmethod
+    def get_snapshot(account: str, summary: UnreadSummary) -> dict:
+        return {
+            "account": account,
+            "unread_count": summary.unread_count,
+            "sender": summary.sender,
+            "subject": summary.subject,
+            "received": summary.received.isoformat() if summary.received is not None else None,
+        }
+
+    def restart_monitoring(self):
+        self.monitor_outlook = self.backend.get_namespace()
+        self.folder_cache.clear()
+        self.stores_without_inbox.clear()
+
     @log_errors
     def on_did_receive_settings(self, obj: events_received_objs.DidReceiveSettings):
         logger.debug(f"on_did_receive_settings: {obj.payload}")
-        update_tiles = False
-        if obj.payload.settings.get(self.ACCOUNT_KEY):
-            self.context_data[obj.context].account = obj.payload.settings.get(self.ACCOUNT_KEY)
-            update_tiles = True
+        settings = obj.payload.settings
+        changes = {}
+        if settings.get(self.ACCOUNT_KEY):
+            changes["account"] = settings.get(self.ACCOUNT_KEY)
 
-        if obj.payload.settings.get(self.EXTRA_INFO_KEY):
-            self.context_data[obj.context].set_extra_info(obj.payload.settings.get(self.EXTRA_INFO_KEY))
-            update_tiles = True
+        if settings.get(self.EXTRA_INFO_KEY):
+            changes["extra_info"] = ContextConfig.parse_extra_info(settings.get(self.EXTRA_INFO_KEY))
 
-        animate_extra_info = obj.payload.settings.get(self.ANIMATE_EXTRA_INFO_KEY)
+        animate_extra_info = settings.get(self.ANIMATE_EXTRA_INFO_KEY)
         if animate_extra_info is not None:
-            self.context_data[obj.context].set_animated(animate_extra_info)
-            update_tiles = True
+            changes["animated"] = ContextConfig.parse_animated(animate_extra_info)
+
+        folders = settings.get(self.FOLDERS_KEY)
+        if folders is not None:
+            changes["folders"] = parse_folder_paths(folders)
 
-        if update_tiles:
+        filter_senders = settings.get(self.FILTER_SENDERS_KEY)
+        filter_subject = settings.get(self.FILTER_SUBJECT_KEY)
+        if filter_senders is not None or filter_subject is not None:
+            changes["unread_filter"] = UnreadFilter.from_settings(filter_senders, filter_subject)
+
+        if changes:
+            # All changes are applied at once, in the next generation of the registry
+            self.registry.update(obj.context, **changes)
             self.wake_event.set()
 
     @log_errors
@@ -125,7 +256,7 @@ class UnreadCounter(Action):
         self.key_press_times[event.context] = time.time()
         # Stop the tile visualizer if it's running
         if event.context in self.context_data:
-            self.context_data[event.context].tile_visualizer.stop()
+            self.context_data[event.context].stop()
         
         def check_long_press():
             key_press_time = self.key_press_times.get(event.context)
@@ -156,30 +287,84 @@ class UnreadCounter(Action):
     @log_errors
     def run_monitoring(self):
         logger.debug(f"Starting monitoring...")
-        self.monitor_outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+        self.backend.init_thread()
+        self.monitor_outlook = self.backend.get_namespace()
         while True:
-            self.wake_event.wait(timeout=self.MAIL_COUNT_UPDATE_INTERVAL)
-            for context in list(self.context_data.keys()):
-                if context in self.key_press_times:
-                    # Skip updating the tile if the key is being held down
-                    continue
-                data = self.context_data.get(context)
-                try:
-                    logger.debug(f"run_monitoring: {context} {data.account}")
-                    self.update_unread_count(outlook=self.monitor_outlook, context=context)
-                except win32com.client.pywintypes.com_error as err:
-                    logger.exception(err)
-                    logger.debug(f"run_monitoring: {context} {data.account} - restarting monitoring")
-                    self.monitor_outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace(
-                        "MAPI"
-                    )
-                except Exception as err:
-                    logger.exception(err)
+            if self.has_work():
+                self.wake_event.wait(timeout=self.MAIL_COUNT_UPDATE_INTERVAL)
+            else:
+                # Nothing to poll, no folders are watched, until a key appears or a client subscribes
+                logger.debug("run_monitoring: idle")
+                self.wake_event.wait()
+            # Cleared before the cycle, so changes published during the cycle trigger the next one.
+            # Events set while waiting are coalesced into this single cycle.
             self.wake_event.clear()
+            self.run_monitoring_cycle()
+
+    def run_monitoring_cycle(self):
+        """Updates every shown key once, called only from the monitoring thread."""
+        if self.resync_event.is_set():
+            self.resync_event.clear()
+            self.folder_cache.invalidate()
+        # Deliver the folder change notifications queued since the last cycle
+        self.backend.pump_messages()
+        # One consistent generation of the settings is used for the whole cycle
+        generation = self.registry.generation
+        watched_folders = set()
+        # Keys of disconnected devices are skipped and their folders released
+        for context, config in generation.get_visible_configs():
+            watched_folders.update(FolderCache.get_keys(config.account, config.folders))
+            if context in self.key_press_times:
+                # Skip updating the tile if the key is being held down
+                continue
+            try:
+                logger.debug(f"run_monitoring: {context} {config.account} generation: {generation.number}")
+                self.update_unread_count(outlook=self.monitor_outlook, context=context, config=config)
+            except self.backend.com_error as err:
+                logger.exception(err)
+                logger.debug(f"run_monitoring: {context} {config.account} - restarting monitoring")
+                self.restart_monitoring()
+            except Exception as err:
+                logger.exception(err)
+        if self.count_service is not None and self.count_service.has_subscribers:
+            try:
+                self.publish_snapshots(self.monitor_outlook, watched_folders)
+            except self.backend.com_error as err:
+                logger.exception(err)
+                logger.debug("run_monitoring: publishing snapshots - restarting monitoring")
+                self.restart_monitoring()
+            except Exception as err:
+                logger.exception(err)
+        self.folder_cache.prune(watched_folders)
+
+
+def start_count_service(port: int) -> CountService:
+    count_service = CountService(port)
+    count_service.start()
+    return count_service
+
+
+def run_headless():
+    """Runs only the monitoring and the count service, without connecting to the Stream Deck."""
+    parser = argparse.ArgumentParser(description="Outlook unread counter service")
+    parser.add_argument(HEADLESS_ARGUMENT, action="store_true")
+    parser.add_argument("--port", type=int, default=settings.COUNT_SERVICE_PORT or DEFAULT_COUNT_SERVICE_PORT)
+    parser.add_argument("--fake-outlook", action="store_true", help="Use in-memory fake accounts")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - [%(levelname)s] - %(message)s")
+    backend = FakeOutlookBackend() if args.fake_outlook else ComOutlookBackend()
+    unread_counter = UnreadCounter(backend=backend, count_service=start_count_service(args.port))
+    unread_counter.run_monitoring().join()
 
 
 if __name__ == "__main__":
-    unread_counter = UnreadCounter()
+    if HEADLESS_ARGUMENT in sys.argv:
+        run_headless()
+        sys.exit()
+
+    count_service = start_count_service(settings.COUNT_SERVICE_PORT) if settings.COUNT_SERVICE_PORT else None
+    unread_counter = UnreadCounter(count_service=count_service)
     unread_counter.run_monitoring()
     StreamDeck(
         actions=[
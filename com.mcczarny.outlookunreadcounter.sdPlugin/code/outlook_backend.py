@@ -0,0 +1,53 @@
+from abc import ABC, abstractmethod
+
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:
+    # pywin32 is available only on Windows, elsewhere only the fake backend can be used.
+    pythoncom = None
+    win32com = None
+
+CDispatch = win32com.client.CDispatch if win32com is not None else object
+
+
+class OutlookBackend(ABC):
+    com_error: type[Exception] = Exception
+
+    def init_thread(self) -> None:
+        """Prepares the calling thread for accessing Outlook, called first by the monitoring thread."""
+        pass
+
+    @abstractmethod
+    def get_namespace(self) -> CDispatch:
+        pass
+
+    @abstractmethod
+    def with_events(self, items: CDispatch, events_class: type) -> object:
+        pass
+
+    def pump_messages(self) -> None:
+        pass
+
+
+class ComOutlookBackend(OutlookBackend):
+    """Talks to the installed Outlook through COM."""
+
+    def __init__(self):
+        if win32com is None:
+            raise RuntimeError("pywin32 is required to access Outlook")
+        self.com_error = win32com.client.pywintypes.com_error
+
+    def init_thread(self) -> None:
+        # A single-threaded apartment delivers the folder events only while the thread pumps messages,
+        # so they never change an index which is being read.
+        pythoncom.CoInitializeEx(pythoncom.COINIT_APARTMENTTHREADED)
+
+    def get_namespace(self) -> CDispatch:
+        return win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+
+    def with_events(self, items: CDispatch, events_class: type) -> object:
+        return win32com.client.WithEvents(items, events_class)
+
+    def pump_messages(self) -> None:
+        pythoncom.PumpWaitingMessages()
@@ -6,3 +6,5 @@ PLUGIN_LOGS_DIR_PATH: Path = Path(os.environ.get("PLUGIN_LOGS_DIR_PATH", Path(__
 PLUGIN_NAME: str = os.environ.get("PLUGIN_NAME", Path(__file__).parents[1].name)
 LOG_FILE_PATH: Path = PLUGIN_LOGS_DIR_PATH / Path(f"{PLUGIN_NAME}.log")
 LOG_LEVEL: int = logging.DEBUG
+# Port of the local count service shared with other tools, 0 disables the service in the plugin
+COUNT_SERVICE_PORT: int = int(os.environ.get("OUTLOOK_UNREAD_COUNT_SERVICE_PORT", 0))
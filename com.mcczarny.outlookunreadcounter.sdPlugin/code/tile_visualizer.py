@@ -1,40 +1,54 @@
 from abc import ABC, abstractmethod
-import win32com.client
+from folder_cache import UnreadSummary
 from mail_states import MailStates
 from streamdeck_sdk import logger, log_errors
-import time
 import threading
 
 
 class TileVisualizer(ABC):
+    __slots__ = ("context", "set_state_callback", "set_title_callback", "last_state", "last_title")
 
-    def __init__(self, set_state_callback: callable, set_title_callback: callable):
+    def __init__(self, context: str, set_state_callback: callable, set_title_callback: callable):
+        self.context = context
         self.set_state_callback = set_state_callback
         self.set_title_callback = set_title_callback
+        self.last_state = None
+        self.last_title = None
 
     def set_state(self, state: MailStates) -> None:
-        self.set_state_callback(state)
+        # Unchanged values are not sent again
+        if state == self.last_state:
+            return
+        self.last_state = state
+        self.set_state_callback(context=self.context, state=state)
 
     def set_title(self, title: str) -> None:
-        self.set_title_callback(title)
+        if title == self.last_title:
+            return
+        self.last_title = title
+        self.set_title_callback(context=self.context, title=title)
 
     def update_state(self, unread_count: int) -> None:
         self.set_state(MailStates.UNREAD if unread_count > 0 else MailStates.READ)
 
     @abstractmethod
-    def update_tile(self, folder: win32com.client.CDispatch) -> None:
+    def update_tile(self, summary: UnreadSummary) -> None:
         pass
 
     def stop(self) -> None:
-        pass
+        # Something else may change the tile now, so the next update has to be sent in full
+        self.last_state = None
+        self.last_title = None
 
 
 class SimpleVisualizer(TileVisualizer):
-    def __init__(self, set_state_callback: callable, set_title_callback: callable):
-        super().__init__(set_state_callback, set_title_callback)
+    __slots__ = ()
+
+    def __init__(self, context: str, set_state_callback: callable, set_title_callback: callable):
+        super().__init__(context, set_state_callback, set_title_callback)
 
-    def update_tile(self, folder: win32com.client.CDispatch) -> None:
-        unread_count = folder.UnReadItemCount
+    def update_tile(self, summary: UnreadSummary) -> None:
+        unread_count = summary.unread_count
         self.update_state(unread_count)
         self.set_title(f"{unread_count}")
 
@@ -43,27 +57,33 @@ EXTRA_INFO_MAX_LENGTH = 9
 
 
 class ExtraInfoVisualizer(SimpleVisualizer):
+    __slots__ = ("show_sender", "show_subject")
+
     def __init__(
         self,
+        context: str,
         set_state_callback: callable,
         set_title_callback: callable,
         show_sender: bool,
         show_subject: bool,
     ):
-        super().__init__(set_state_callback, set_title_callback)
+        super().__init__(context, set_state_callback, set_title_callback)
         self.show_sender = show_sender
         self.show_subject = show_subject
 
-    def update_tile(self, folder: win32com.client.CDispatch) -> None:
-        unread_count = folder.UnReadItemCount
-        if unread_count == 0:
-            super().update_tile(folder)
+    def configure(self, show_sender: bool, show_subject: bool) -> None:
+        self.show_sender = show_sender
+        self.show_subject = show_subject
+
+    def update_tile(self, summary: UnreadSummary) -> None:
+        unread_count = summary.unread_count
+        if unread_count == 0 or not summary.has_details:
+            super().update_tile(summary)
         else:
             self.set_state(MailStates.UNREAD)
 
-            last_unread_email = folder.Items.Restrict("[UnRead] = True").GetLast()
-            sender = last_unread_email.SenderName
-            subject = last_unread_email.Subject
+            sender = summary.sender
+            subject = summary.subject
 
             extra_info = ""
             if self.show_sender:
@@ -85,38 +105,48 @@ class ExtraInfoVisualizer(SimpleVisualizer):
 
 class AnimatedExtraInfoVisualizer(ExtraInfoVisualizer):
     class TileAnimation:
-        def __init__(self, set_title: callable, unread_count: int, sender: str, subject: str):
-            # TODO: Move it to single place with update interval
-            self.FIRST_FRAME_DURATION_SECONDS = 1
-            self.FRAME_DURATION_SECONDS = 0.5
-            self.MAX_FRAMES = 15
-            self.CHARACTERS_PER_FRAME = 2
+        __slots__ = ("set_title", "unread_count", "sender", "subject", "stopped", "thread")
 
+        # TODO: Move it to single place with update interval
+        FIRST_FRAME_DURATION_SECONDS = 1
+        FRAME_DURATION_SECONDS = 0.5
+        MAX_FRAMES = 15
+        CHARACTERS_PER_FRAME = 2
+
+        def __init__(self, set_title: callable, unread_count: int, sender: str, subject: str):
             self.set_title = set_title
             self.unread_count = unread_count
             self.sender = sender
             self.subject = subject
-            self.animation_frame = 0
+            self.stopped = threading.Event()
             self.thread = None
 
         def start(self):
             logger.debug(f"start animation: {self.unread_count} {self.sender} {self.subject}")
-            self.thread = threading.Thread(target=self.animate)
+            self.thread = threading.Thread(target=self.animate, daemon=True)
             self.thread.start()
 
+        def shows(self, unread_count: int, sender: str, subject: str) -> bool:
+            return (self.unread_count, self.sender, self.subject) == (unread_count, sender, subject)
+
+        def stop(self):
+            # Wakes the animation thread up, so it ends right away instead of after the remaining frames
+            self.stopped.set()
+
         @log_errors
         def animate(self):
             animation_index = 0
             reached_end = False
-            while threading.current_thread() == self.thread and not reached_end and animation_index < self.MAX_FRAMES:
+            while not self.stopped.is_set() and not reached_end and animation_index < self.MAX_FRAMES:
                 logger.debug(f"animation frame: {animation_index}")
                 reached_end = self.show_frame(animation_index)
                 animation_index = animation_index + 1
-                time.sleep(
+                self.stopped.wait(
                     self.FIRST_FRAME_DURATION_SECONDS if animation_index == 0 else self.FRAME_DURATION_SECONDS
                 )
             # After the animation is finished, show beginning of the extra info
-            _ = self.show_frame(0)
+            if not self.stopped.is_set():
+                _ = self.show_frame(0)
 
         def get_line_for_frame(self, animation_frame: int, text: str) -> tuple[str, bool]:
             """
@@ -151,30 +181,34 @@ class AnimatedExtraInfoVisualizer(ExtraInfoVisualizer):
             self.set_title(title)
             return sender_reached_end and subject_reached_end
 
+    __slots__ = ("animation",)
+
     def __init__(
         self,
+        context: str,
         set_state_callback: callable,
         set_title_callback: callable,
         show_sender: bool,
         show_subject: bool,
     ):
-        super().__init__(set_state_callback, set_title_callback, show_sender, show_subject)
+        super().__init__(context, set_state_callback, set_title_callback, show_sender, show_subject)
         self.animation = None
 
-    def update_tile(self, folder: win32com.client.CDispatch) -> None:
-        unread_count = folder.UnReadItemCount
-        if unread_count == 0:
-            super().update_tile(folder)
+    def update_tile(self, summary: UnreadSummary) -> None:
+        unread_count = summary.unread_count
+        if unread_count == 0 or not summary.has_details:
+            self.stop_animation()
+            super().update_tile(summary)
         else:
             self.set_state(MailStates.UNREAD)
-            last_unread_email = folder.Items.Restrict("[UnRead] = True").GetLast()
-            # Sometimes Outlook shows an unread counter > 0, but there are no unread emails.
-            # Maybe it's caused by sync errors, because the unread message appears after a few minutes.
-            if not ("SenderName" in dir(last_unread_email) and "Subject" in dir(last_unread_email)):
-                super().update_tile(folder)
+            sender = summary.sender
+            subject = summary.subject
+            # Read once, the animation may be stopped from another thread meanwhile
+            animation = self.animation
+            if animation is not None and animation.shows(unread_count, sender, subject):
+                # The same email is animated already or was animated until the end
                 return
-            sender = last_unread_email.SenderName
-            subject = last_unread_email.Subject
+            self.stop_animation()
             self.animation = self.TileAnimation(self.set_title, unread_count, sender, subject)
             self.animation.start()
 
@@ -190,6 +224,11 @@ class AnimatedExtraInfoVisualizer(ExtraInfoVisualizer):
         )
 
     def stop(self):
-        if self.animation is not None:
-            self.animation.thread = None
-            self.animation = None
+        super().stop()
+        self.stop_animation()
+
+    def stop_animation(self):
+        animation = self.animation
+        self.animation = None
+        if animation is not None:
+            animation.stop()
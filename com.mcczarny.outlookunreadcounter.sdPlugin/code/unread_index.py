@@ -0,0 +1,147 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from outlook_backend import CDispatch
+from streamdeck_sdk import logger
+
+# SenderEmailAddress of Exchange senders is an X.500 distinguished name, this property is their SMTP address
+SENDER_SMTP_ADDRESS_PROPERTY = "http://schemas.microsoft.com/mapi/proptag/0x5D02001F"
+EXCHANGE_ADDRESS_TYPE = "EX"
+UNREAD_TABLE_FILTER = "[UnRead] = True"
+UNREAD_TABLE_COLUMNS = (
+    "EntryID",
+    "SenderName",
+    "SenderEmailAddress",
+    SENDER_SMTP_ADDRESS_PROPERTY,
+    "Subject",
+    "ReceivedTime",
+)
+RECEIVED_TIME_COLUMN = UNREAD_TABLE_COLUMNS.index("ReceivedTime") + 1  # Table columns are indexed from 1
+FILTER_LIST_SEPARATORS_REGEX = re.compile(r"[\n;]+")
+
+
+@dataclass(frozen=True, slots=True)
+class UnreadItem:
+    entry_id: str
+    sender: str
+    sender_address: str
+    subject: str
+    received: datetime | None
+
+    @classmethod
+    def from_outlook_item(cls, item: CDispatch) -> "UnreadItem":
+        # Not every item is an email (e.g. meeting requests, reports), so the fields are optional.
+        sender_address = getattr(item, "SenderEmailAddress", "") or ""
+        if getattr(item, "SenderEmailType", "") == EXCHANGE_ADDRESS_TYPE:
+            try:
+                sender_address = (
+                    item.PropertyAccessor.GetProperty(SENDER_SMTP_ADDRESS_PROPERTY) or sender_address
+                )
+            except Exception as err:
+                logger.debug(f"SMTP address of {item.EntryID} is unavailable: {err}")
+        return cls(
+            entry_id=item.EntryID,
+            sender=getattr(item, "SenderName", "") or "",
+            sender_address=sender_address,
+            subject=getattr(item, "Subject", "") or "",
+            received=getattr(item, "ReceivedTime", None),
+        )
+
+    @classmethod
+    def from_table_row(cls, row: CDispatch) -> "UnreadItem":
+        entry_id, sender, sender_address, smtp_address, subject, _ = row.GetValues()
+        return cls(
+            entry_id=entry_id,
+            sender=sender or "",
+            sender_address=smtp_address or sender_address or "",
+            subject=subject or "",
+            # Table dates are in UTC, while the items report the local time
+            received=row.UTCToLocalTime(RECEIVED_TIME_COLUMN),
+        )
+
+
+@dataclass(frozen=True)
+class UnreadFilter:
+    """
+    Predicate for unread items. An item matches if its sender name or address contains one of the senders
+    and its subject contains one of the keywords. An empty list matches every item.
+    """
+
+    senders: tuple[str, ...] = ()
+    subject_keywords: tuple[str, ...] = ()
+
+    @staticmethod
+    def _parse(text: str | None) -> tuple[str, ...]:
+        if not text:
+            return ()
+        entries = FILTER_LIST_SEPARATORS_REGEX.split(text)
+        return tuple(entry.strip().casefold() for entry in entries if entry.strip())
+
+    @classmethod
+    def from_settings(cls, senders: str | None, subject_keywords: str | None) -> "UnreadFilter":
+        return cls(senders=cls._parse(senders), subject_keywords=cls._parse(subject_keywords))
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.senders and not self.subject_keywords
+
+    def matches(self, item: UnreadItem) -> bool:
+        if self.senders:
+            sender = item.sender.casefold()
+            sender_address = item.sender_address.casefold()
+            if not any(entry in sender or entry in sender_address for entry in self.senders):
+                return False
+        if self.subject_keywords:
+            subject = item.subject.casefold()
+            if not any(keyword in subject for keyword in self.subject_keywords):
+                return False
+        return True
+
+
+class UnreadIndex:
+    """
+    Unread items of a single folder keyed by EntryID.
+    Seeded once from the folder and then kept up to date from the folder's item events.
+    """
+
+    def __init__(self):
+        self.items: dict[str, UnreadItem] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def seed(self, folder: CDispatch) -> None:
+        # A table loads only the indexed properties instead of the whole items
+        table = folder.GetTable(UNREAD_TABLE_FILTER)
+        table.Columns.RemoveAll()
+        for column in UNREAD_TABLE_COLUMNS:
+            table.Columns.Add(column)
+        items = {}
+        while not table.EndOfTable:
+            unread_item = UnreadItem.from_table_row(table.GetNextRow())
+            items[unread_item.entry_id] = unread_item
+        self.items = items
+        logger.debug(f"Unread index seeded with {len(items)} items")
+
+    def update(self, item: CDispatch) -> None:
+        """Applies an added or changed item."""
+        if getattr(item, "UnRead", False):
+            unread_item = UnreadItem.from_outlook_item(item)
+            self.items[unread_item.entry_id] = unread_item
+        else:
+            self.items.pop(item.EntryID, None)
+
+    def count(self, unread_filter: UnreadFilter) -> int:
+        if unread_filter.is_empty:
+            return len(self.items)
+        return sum(1 for item in self.items.values() if unread_filter.matches(item))
+
+    def newest(self, unread_filter: UnreadFilter) -> UnreadItem | None:
+        newest_item = None
+        for item in self.items.values():
+            if item.received is None or not unread_filter.matches(item):
+                continue
+            if newest_item is None or item.received > newest_item.received:
+                newest_item = item
+        return newest_item
@@ -32,6 +32,21 @@ def main():
                     ),
                 ],
             ),
+            Textarea(
+                uid="folders",
+                label="Folders",
+                placeholder="Inbox",
+            ),
+            Textfield(
+                uid="filter_senders",
+                label="Sender filter",
+                placeholder="Any sender",
+            ),
+            Textfield(
+                uid="filter_subject",
+                label="Subject filter",
+                placeholder="Any subject",
+            ),
         ]
     )
     pi.build(output_dir=OUTPUT_DIR, template=TEMPLATE)
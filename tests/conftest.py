@@ -0,0 +1,111 @@
+import pytest
+from streamdeck_sdk import events_received_objs
+
+from fake_outlook import FakeOutlookBackend
+from main import UnreadCounter
+
+ACCOUNT = "me@example.com"
+DEVICE = "device-1"
+
+
+class SentMessages:
+    """Titles and states sent to the Stream Deck, in the order they were sent."""
+
+    def __init__(self):
+        self.titles: list[tuple[str, str]] = []
+        self.states: list[tuple[str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.titles) + len(self.states)
+
+    def clear(self) -> None:
+        self.titles.clear()
+        self.states.clear()
+
+
+def will_appear(context: str, settings: dict | None = None, device: str = DEVICE):
+    return events_received_objs.WillAppear.model_validate(
+        {
+            "action": UnreadCounter.UUID,
+            "event": "willAppear",
+            "context": context,
+            "device": device,
+            "payload": {"settings": settings or {}, "isInMultiAction": False},
+        }
+    )
+
+
+def will_disappear(context: str, device: str = DEVICE):
+    return events_received_objs.WillDisappear.model_validate(
+        {
+            "action": UnreadCounter.UUID,
+            "event": "willDisappear",
+            "context": context,
+            "device": device,
+            "payload": {"settings": {}, "isInMultiAction": False},
+        }
+    )
+
+
+def did_receive_settings(context: str, settings: dict, device: str = DEVICE):
+    return events_received_objs.DidReceiveSettings.model_validate(
+        {
+            "action": UnreadCounter.UUID,
+            "event": "didReceiveSettings",
+            "context": context,
+            "device": device,
+            "payload": {
+                "settings": settings,
+                "isInMultiAction": False,
+                "coordinates": {"column": 0, "row": 0},
+            },
+        }
+    )
+
+
+def device_did_connect(device: str = DEVICE):
+    return events_received_objs.DeviceDidConnect.model_validate(
+        {
+            "event": "deviceDidConnect",
+            "device": device,
+            "deviceInfo": {"name": "Stream Deck", "type": 0, "size": {"columns": 5, "rows": 3}},
+        }
+    )
+
+
+def device_did_disconnect(device: str = DEVICE):
+    return events_received_objs.DeviceDidDisconnect.model_validate(
+        {"event": "deviceDidDisconnect", "device": device}
+    )
+
+
+def system_did_wake_up():
+    return events_received_objs.SystemDidWakeUp.model_validate({"event": "systemDidWakeUp"})
+
+
+@pytest.fixture
+def backend() -> FakeOutlookBackend:
+    return FakeOutlookBackend([ACCOUNT])
+
+
+@pytest.fixture
+def sent() -> SentMessages:
+    return SentMessages()
+
+
+@pytest.fixture
+def unread_counter(backend: FakeOutlookBackend, sent: SentMessages):
+    """UnreadCounter on the fake backend, the monitoring cycles are run by the tests."""
+    unread_counter = UnreadCounter(backend=backend)
+    unread_counter.monitor_outlook = backend.get_namespace()
+    unread_counter.set_settings = lambda context, payload: None
+    unread_counter.set_title = lambda context, title: sent.titles.append((context, title))
+    unread_counter.set_state = lambda context, state: sent.states.append((context, state))
+    yield unread_counter
+    # The runtime state is shared by the class
+    for data in unread_counter.context_data.values():
+        data.release()
+    unread_counter.context_data.clear()
+    unread_counter.key_press_times.clear()
+    unread_counter.wake_event.clear()
+    unread_counter.resync_event.clear()
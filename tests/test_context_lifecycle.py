@@ -0,0 +1,145 @@
+import gc
+import logging
+import threading
+import time
+import tracemalloc
+
+from conftest import ACCOUNT, device_did_disconnect, will_appear, will_disappear
+from context_data import ContextConfig
+from folder_cache import UnreadSummary
+
+ANIMATED_SETTINGS = {"extra_info": "Both", "animate_extra_info": True}
+# Longer than a frame of the tile animation, so a running animation would send a title meanwhile
+TILE_ANIMATION_FRAME_SECONDS = 0.6
+SOAK_ROUNDS = 500
+WARM_UP_ROUNDS = 20
+# Far below what 500 rounds of leaked keys, visualizers or folder watches would take
+MAX_MEMORY_GROWTH_BYTES = 64 * 1024
+
+
+def wait_for_threads(count: int, timeout: float = 5.0) -> int:
+    deadline = time.monotonic() + timeout
+    while threading.active_count() > count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def take_memory_snapshot(threads: int) -> tracemalloc.Snapshot:
+    wait_for_threads(threads)
+    gc.collect()
+    return tracemalloc.take_snapshot()
+
+
+def test_appear_disappear_soak_releases_everything(unread_counter, backend, sent):
+    backend.get_store(ACCOUNT).inbox.deliver("Jane Doe With A Long Name", "A subject which needs scrolling")
+    contexts = [f"context-{index}" for index in range(4)]
+    threads_before = threading.active_count()
+
+    def run_round():
+        for context in contexts:
+            unread_counter.on_will_appear(will_appear(context, ANIMATED_SETTINGS))
+        unread_counter.run_monitoring_cycle()
+        for context in contexts:
+            unread_counter.on_will_disappear(will_disappear(context))
+        unread_counter.run_monitoring_cycle()
+        sent.clear()
+
+    # Caches filled by the first rounds, e.g. of the event models, are not growth
+    for _ in range(WARM_UP_ROUNDS):
+        run_round()
+    tracemalloc.start()
+    try:
+        memory_before = take_memory_snapshot(threads_before)
+        for _ in range(SOAK_ROUNDS):
+            run_round()
+        memory_after = take_memory_snapshot(threads_before)
+    finally:
+        tracemalloc.stop()
+
+    memory_growth = sum(stat.size_diff for stat in memory_after.compare_to(memory_before, "filename"))
+    assert memory_growth < MAX_MEMORY_GROWTH_BYTES
+    assert unread_counter.context_data == {}
+    assert unread_counter.key_press_times == {}
+    assert len(unread_counter.registry.generation.configs) == 0
+    assert unread_counter.folder_cache.folders == {}
+    # Every animation thread ends when its key disappears
+    assert wait_for_threads(threads_before) <= threads_before
+    sent.clear()
+    time.sleep(TILE_ANIMATION_FRAME_SECONDS)
+    assert len(sent) == 0
+
+
+def test_released_context_shows_nothing(unread_counter, sent):
+    unread_counter.on_will_appear(will_appear("context", ANIMATED_SETTINGS))
+    data = unread_counter.context_data["context"]
+    unread_counter.on_will_disappear(will_disappear("context"))
+    sent.clear()
+
+    summary = UnreadSummary(unread_count=1, sender="Jane", subject="Hello")
+    data.show_summary(ContextConfig(account=ACCOUNT), summary)
+    data.show_error("Error")
+
+    assert len(sent) == 0
+    assert data.visualizers == {}
+
+
+def test_disappear_during_monitoring_cycle(unread_counter, backend, sent):
+    backend.get_store(ACCOUNT).inbox.deliver("Jane Doe With A Long Name", "A subject which needs scrolling")
+    unread_counter.on_will_appear(will_appear("context", ANIMATED_SETTINGS))
+    get_summary = unread_counter.folder_cache.get_summary
+
+    def get_summary_and_disappear(*args):
+        summary = get_summary(*args)
+        # The key disappears after the cycle took its data, before the tile is updated
+        unread_counter.on_will_disappear(will_disappear("context"))
+        sent.clear()
+        return summary
+
+    unread_counter.folder_cache.get_summary = get_summary_and_disappear
+    unread_counter.run_monitoring_cycle()
+    time.sleep(TILE_ANIMATION_FRAME_SECONDS)
+
+    assert len(sent) == 0
+
+
+def test_device_disconnect_during_monitoring_cycle(unread_counter, backend, sent):
+    backend.get_store(ACCOUNT).inbox.deliver("Jane Doe With A Long Name", "A subject which needs scrolling")
+    unread_counter.on_will_appear(will_appear("context", ANIMATED_SETTINGS))
+    get_summary = unread_counter.folder_cache.get_summary
+
+    def get_summary_and_disconnect(*args):
+        summary = get_summary(*args)
+        # The device disconnects after the cycle took the generation, before the tile is updated
+        unread_counter.on_device_did_disconnect(device_did_disconnect())
+        sent.clear()
+        return summary
+
+    unread_counter.folder_cache.get_summary = get_summary_and_disconnect
+    unread_counter.run_monitoring_cycle()
+    time.sleep(TILE_ANIMATION_FRAME_SECONDS)
+
+    assert len(sent) == 0
+    assert unread_counter.context_data["context"].tile_visualizer is None
+
+
+def test_stopping_while_the_tile_is_updated(unread_counter, backend, caplog):
+    inbox = backend.get_store(ACCOUNT).inbox
+    unread_counter.on_will_appear(will_appear("context", ANIMATED_SETTINGS))
+    data = unread_counter.context_data["context"]
+    stop = threading.Event()
+
+    def press_keys():
+        while not stop.is_set():
+            data.stop()
+
+    thread = threading.Thread(target=press_keys)
+    with caplog.at_level(logging.ERROR):
+        thread.start()
+        for index in range(300):
+            # A new email each time, so every cycle starts a new animation
+            inbox.deliver("Jane Doe With A Long Name", f"Subject number {index}")
+            unread_counter.run_monitoring_cycle()
+        stop.set()
+        thread.join()
+
+    assert [record for record in caplog.records if record.levelno >= logging.ERROR] == []
@@ -0,0 +1,120 @@
+import logging
+import threading
+
+import pytest
+
+from conftest import ACCOUNT, did_receive_settings, will_appear
+from context_data import ContextConfig
+from context_registry import ContextRegistry
+from fake_outlook import FakeOutlookBackend
+
+OTHER_ACCOUNT = "other@example.com"
+WRITERS = 4
+UPDATES_PER_WRITER = 2000
+
+
+def get_version(config: ContextConfig) -> tuple[str, str]:
+    return config.account.partition("@")[0], config.folders[0]
+
+
+def test_readers_see_consistent_generations():
+    registry = ContextRegistry()
+    contexts = [f"context-{index}" for index in range(8)]
+    for context in contexts:
+        registry.set(context, ContextConfig(account="0@example.com", folders=("0",)))
+    stop = threading.Event()
+    errors = []
+
+    def write(writer: int):
+        for update in range(UPDATES_PER_WRITER):
+            version = f"{writer}-{update}"
+            # Both fields change in a single update, a reader must never see only one of them
+            registry.update(
+                contexts[update % len(contexts)], account=f"{version}@example.com", folders=(version,)
+            )
+
+    def read():
+        last_number = -1
+        while not stop.is_set():
+            generation = registry.generation
+            if generation.number < last_number:
+                errors.append(f"Generation went back from {last_number} to {generation.number}")
+            last_number = generation.number
+            for config in generation.configs.values():
+                account_version, folders_version = get_version(config)
+                if account_version != folders_version:
+                    errors.append(f"Inconsistent configuration {config}")
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    writers = [threading.Thread(target=write, args=(writer,)) for writer in range(WRITERS)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert registry.generation.number == len(contexts) + WRITERS * UPDATES_PER_WRITER
+
+
+def test_generation_cannot_be_modified():
+    registry = ContextRegistry()
+    registry.set("context", ContextConfig(account=ACCOUNT))
+    generation = registry.generation
+
+    with pytest.raises(TypeError):
+        generation.configs["other"] = ContextConfig(account=ACCOUNT)
+    registry.remove("context")
+
+    assert "context" in generation.configs
+    assert registry.get("context") is None
+
+
+@pytest.fixture
+def backend() -> FakeOutlookBackend:
+    backend = FakeOutlookBackend([ACCOUNT, OTHER_ACCOUNT])
+    backend.get_store(ACCOUNT).inbox.deliver("Jane", "One")
+    for subject in ["Two", "Three"]:
+        backend.get_store(OTHER_ACCOUNT).inbox.deliver("John", subject)
+    return backend
+
+
+def test_settings_changes_during_monitoring(unread_counter, sent, caplog):
+    contexts = [f"context-{index}" for index in range(4)]
+    for context in contexts:
+        unread_counter.on_will_appear(will_appear(context))
+    stop = threading.Event()
+
+    def monitor():
+        while not stop.is_set():
+            unread_counter.run_monitoring_cycle()
+
+    def change_settings(context: str):
+        for update in range(300):
+            account = OTHER_ACCOUNT if update % 2 else ACCOUNT
+            extra_info = "Sender" if update % 3 else "None"
+            unread_counter.on_did_receive_settings(
+                did_receive_settings(context, {"account": account, "extra_info": extra_info})
+            )
+
+    monitor_thread = threading.Thread(target=monitor)
+    writers = [threading.Thread(target=change_settings, args=(context,)) for context in contexts]
+    with caplog.at_level(logging.ERROR):
+        monitor_thread.start()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        monitor_thread.join()
+        # One more cycle shows the final settings
+        unread_counter.run_monitoring_cycle()
+
+    assert [record for record in caplog.records if record.levelno >= logging.ERROR] == []
+    final_titles = {context: title for context, title in sent.titles}
+    for context in contexts:
+        config = unread_counter.registry.get(context)
+        assert (config.account, config.extra_info) == (OTHER_ACCOUNT, "Sender")
+        assert final_titles[context] == "2\nJohn"
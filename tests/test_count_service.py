@@ -0,0 +1,101 @@
+import json
+import socket
+import time
+
+import pytest
+
+from conftest import ACCOUNT, will_appear
+from count_service import COUNT_SERVICE_HOST, CountService
+from fake_outlook import FakeOutlookBackend
+
+PUBLIC_FOLDERS = "Public Folders"
+
+
+@pytest.fixture
+def backend() -> FakeOutlookBackend:
+    backend = FakeOutlookBackend([ACCOUNT, PUBLIC_FOLDERS])
+    # Stores like Public Folders have no Inbox
+    backend.get_store(PUBLIC_FOLDERS).inbox = None
+    backend.get_store(ACCOUNT).inbox.deliver("Jane", "Hello")
+    return backend
+
+
+@pytest.fixture
+def count_service():
+    count_service = CountService(0)
+    count_service.start()
+    yield count_service
+    count_service.stop()
+
+
+@pytest.fixture
+def client(count_service):
+    connection = socket.create_connection((COUNT_SERVICE_HOST, count_service.port), timeout=5)
+    yield connection
+    connection.close()
+
+
+def wait_for_subscriber(count_service: CountService, subscribed: bool = True, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while count_service.has_subscribers != subscribed and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def read_snapshot(reader) -> dict:
+    return json.loads(reader.readline())
+
+
+def test_stores_without_inbox_are_skipped(unread_counter, backend, count_service, client):
+    unread_counter.count_service = count_service
+    unread_counter.on_will_appear(will_appear("context"))
+    reader = client.makefile("r")
+    wait_for_subscriber(count_service)
+    unread_counter.run_monitoring_cycle()
+    assert read_snapshot(reader)["unread_count"] == 1
+    backend.calls.clear()
+
+    for _ in range(10):
+        unread_counter.run_monitoring_cycle()
+
+    # The monitoring does not restart, so the folders are not read again
+    assert backend.calls["GetTable"] == 0
+    assert set(count_service.snapshots) == {ACCOUNT}
+    assert unread_counter.stores_without_inbox == {PUBLIC_FOLDERS}
+
+
+@pytest.mark.parametrize("request_line", ['{"subscribe": 5}', '{"subscribe": "me"}', '["me"]', "not json"])
+def test_invalid_subscriptions_are_ignored(count_service, client, request_line):
+    count_service.publish({ACCOUNT: {"account": ACCOUNT, "unread_count": 1}})
+    reader = client.makefile("r")
+    assert read_snapshot(reader)["unread_count"] == 1
+
+    client.sendall(f"{request_line}\n".encode("utf-8"))
+    client.sendall(json.dumps({"subscribe": [ACCOUNT]}).encode("utf-8") + b"\n")
+
+    # The client stays connected and its valid request is still handled
+    assert read_snapshot(reader) == {"account": ACCOUNT, "unread_count": 1}
+
+
+def test_reconnecting_client_gets_no_outdated_counts(unread_counter, backend, count_service, client):
+    unread_counter.count_service = count_service
+    reader = client.makefile("r")
+    wait_for_subscriber(count_service)
+    unread_counter.run_monitoring_cycle()
+    assert read_snapshot(reader)["unread_count"] == 1
+    reader.close()
+    client.close()
+    wait_for_subscriber(count_service, subscribed=False)
+
+    # Nothing is published while nobody is subscribed
+    backend.get_store(ACCOUNT).inbox.deliver("John", "While nobody listened")
+    unread_counter.run_monitoring_cycle()
+    with socket.create_connection((COUNT_SERVICE_HOST, count_service.port), timeout=5) as other_client:
+        wait_for_subscriber(count_service)
+        other_client.settimeout(0.2)
+        with pytest.raises(socket.timeout):
+            other_client.recv(1)
+        other_client.settimeout(5)
+
+        unread_counter.run_monitoring_cycle()
+
+        assert read_snapshot(other_client.makefile("r"))["unread_count"] == 2
@@ -0,0 +1,162 @@
+import pytest
+
+from conftest import ACCOUNT, will_appear
+from fake_outlook import FakeOutlookBackend
+from folder_cache import FolderCache
+from main import UnreadCounter
+from unread_index import UnreadFilter
+
+OTHER_ACCOUNT = "other@example.com"
+FOLDER_COUNT = 40
+
+
+def get_watched_folder(unread_counter, path: str, account: str = ACCOUNT):
+    folder_cache = unread_counter.folder_cache
+    return folder_cache.folders[folder_cache.paths[(account, path)]]
+
+
+def get_titles(sent) -> dict[str, str]:
+    return {context: title for context, title in sent.titles}
+
+
+def test_missing_folder_is_an_error_of_its_key(unread_counter, backend, sent):
+    backend.get_store(ACCOUNT).inbox.deliver("Jane", "Hello")
+    unread_counter.on_will_appear(will_appear("inbox"))
+    unread_counter.on_will_appear(will_appear("typo", {"folders": "Inbox/Typo"}))
+    unread_counter.run_monitoring_cycle()
+    inbox_folder = get_watched_folder(unread_counter, "")
+    backend.calls.clear()
+    sent.clear()
+
+    for _ in range(10):
+        unread_counter.run_monitoring_cycle()
+
+    # The other key keeps its cached folder and the error is sent only once
+    assert get_watched_folder(unread_counter, "") is inbox_folder
+    assert backend.calls["GetTable"] == 0
+    assert sent.titles == []
+    assert unread_counter.context_data["typo"].error == UnreadCounter.FOLDER_NOT_FOUND_TITLE
+
+
+def test_fixed_folder_shows_the_count_again(unread_counter, backend, sent):
+    backend.get_store(ACCOUNT).inbox.add_folder("Alerts").deliver("Monitor", "Disk full")
+    unread_counter.on_will_appear(will_appear("alerts", {"folders": "Inbox/Alert"}))
+    unread_counter.run_monitoring_cycle()
+    assert sent.titles == [("alerts", "Loading..."), ("alerts", UnreadCounter.FOLDER_NOT_FOUND_TITLE)]
+    sent.clear()
+
+    unread_counter.registry.update("alerts", folders=("Inbox/Alerts",))
+    unread_counter.run_monitoring_cycle()
+
+    assert sent.titles == [("alerts", "1")]
+    assert unread_counter.context_data["alerts"].error is None
+
+
+@pytest.fixture
+def backend() -> FakeOutlookBackend:
+    return FakeOutlookBackend([ACCOUNT, OTHER_ACCOUNT])
+
+
+@pytest.fixture
+def project_folders(backend):
+    inbox = backend.get_store(ACCOUNT).inbox
+    return [inbox.add_folder(f"Project {index}") for index in range(FOLDER_COUNT)]
+
+
+def test_folders_are_summed(unread_counter, backend, sent):
+    inbox = backend.get_store(ACCOUNT).inbox
+    inbox.deliver("Jane", "Older")
+    inbox.add_folder("Alerts").deliver("Monitor", "Newest")
+    unread_counter.on_will_appear(
+        will_appear("context", {"folders": "Inbox\nInbox/Alerts", "extra_info": "Both"})
+    )
+
+    unread_counter.run_monitoring_cycle()
+
+    assert get_titles(sent)["context"] == "2\nMonitor\nNewest"
+
+
+@pytest.mark.parametrize("path", ["\\\\other@example.com\\Inbox", "\\\\other@example.com/Inbox"])
+def test_folder_of_another_account(unread_counter, backend, sent, path):
+    backend.get_store(OTHER_ACCOUNT).inbox.deliver("John", "Hello")
+    unread_counter.on_will_appear(will_appear("context", {"folders": path}))
+
+    unread_counter.run_monitoring_cycle()
+
+    assert get_titles(sent)["context"] == "1"
+
+
+def test_paths_of_the_same_folder_share_one_watch(unread_counter, backend, sent):
+    inbox = backend.get_store(ACCOUNT).inbox
+    for context, path in [("default", ""), ("relative", "Inbox"), ("store", "\\\\me@example.com\\Inbox")]:
+        unread_counter.on_will_appear(will_appear(context, {"folders": path}))
+    unread_counter.on_will_appear(will_appear("all", {"folders": "Inbox;\\\\me@example.com\\Inbox"}))
+    unread_counter.run_monitoring_cycle()
+    backend.calls.clear()
+    sent.clear()
+
+    inbox.deliver("Jane", "Hello")
+    unread_counter.run_monitoring_cycle()
+
+    assert len(unread_counter.folder_cache.folders) == 1
+    assert len(inbox.event_sinks) == 1
+    assert sum(backend.calls.values()) == 0
+    # The folder is counted once even if a key names it twice
+    assert get_titles(sent) == {"default": "1", "relative": "1", "store": "1", "all": "1"}
+
+
+def test_idle_folders_are_not_read(unread_counter, backend, project_folders):
+    paths = "\n".join(f"Inbox/{folder.Name}" for folder in project_folders)
+    unread_counter.on_will_appear(will_appear("context", {"folders": paths}))
+    unread_counter.run_monitoring_cycle()
+    assert backend.calls["GetTable"] == FOLDER_COUNT
+    backend.calls.clear()
+
+    for _ in range(10):
+        unread_counter.run_monitoring_cycle()
+
+    assert sum(backend.calls.values()) == 0
+
+
+def test_only_the_changed_folder_is_read_again(backend, project_folders, monkeypatch):
+    monkeypatch.setattr(FolderCache, "CHANGE_STAMP_CHECK_INTERVAL", 0)
+    folder_cache = FolderCache(backend)
+    outlook = backend.get_namespace()
+    paths = tuple(f"Inbox/{folder.Name}" for folder in project_folders)
+    mails = [folder.deliver("Jane", "Hello") for folder in project_folders]
+    assert folder_cache.get_summary(outlook, ACCOUNT, paths, UnreadFilter()).unread_count == FOLDER_COUNT
+    backend.pump_messages()
+
+    # Removed: the notification makes the count of that folder checked
+    project_folders[3].remove(mails[3])
+    # Read without a notification: only the moved change stamp shows it
+    mails[7]._unread = False
+    project_folders[7].change_stamp += 1
+    backend.pump_messages()
+    backend.calls.clear()
+
+    assert folder_cache.get_summary(outlook, ACCOUNT, paths, UnreadFilter()).unread_count == FOLDER_COUNT - 2
+    assert backend.calls["UnReadItemCount"] == 2
+    assert backend.calls["GetTable"] == 2
+
+
+def test_change_stamp_without_notifications(backend, monkeypatch):
+    def with_events(items, events_class):
+        raise RuntimeError("Events are not supported")
+
+    monkeypatch.setattr(backend, "with_events", with_events)
+    folder_cache = FolderCache(backend)
+    outlook = backend.get_namespace()
+    inbox = backend.get_store(ACCOUNT).inbox
+    folder_cache.get_summary(outlook, ACCOUNT, (), UnreadFilter())
+    backend.calls.clear()
+
+    # Unchanged stamp: only the stamp is read
+    assert folder_cache.get_summary(outlook, ACCOUNT, (), UnreadFilter()).unread_count == 0
+    assert dict(backend.calls) == {"GetProperty": 1}
+
+    inbox.deliver("Jane", "Hello")
+    backend.calls.clear()
+    # Moved stamp: the folder is read again right away, there is no notification to wait for
+    assert folder_cache.get_summary(outlook, ACCOUNT, (), UnreadFilter()).unread_count == 1
+    assert backend.calls["GetTable"] == 1
@@ -0,0 +1,116 @@
+import pytest
+
+from conftest import (
+    ACCOUNT,
+    device_did_connect,
+    device_did_disconnect,
+    system_did_wake_up,
+    will_appear,
+    will_disappear,
+)
+from tile_visualizer import AnimatedExtraInfoVisualizer
+
+KEY_SETTINGS = {
+    "simple": {},
+    "sender": {"extra_info": "Sender"},
+    "animated": {"extra_info": "Both", "animate_extra_info": True},
+}
+# 8 hours at the default interval of 10 seconds
+NIGHT_CYCLES = 8 * 60 * 60 // 10
+
+
+@pytest.fixture(autouse=True)
+def fast_animation(monkeypatch):
+    monkeypatch.setattr(AnimatedExtraInfoVisualizer.TileAnimation, "FIRST_FRAME_DURATION_SECONDS", 0)
+    monkeypatch.setattr(AnimatedExtraInfoVisualizer.TileAnimation, "FRAME_DURATION_SECONDS", 0)
+
+
+@pytest.fixture
+def shown_keys(unread_counter, backend, sent):
+    """Every kind of key, shown and updated once with an unread email which needs scrolling."""
+    backend.get_store(ACCOUNT).inbox.deliver("Jane Doe With A Long Name", "A subject which needs scrolling")
+    for context, settings in KEY_SETTINGS.items():
+        unread_counter.on_will_appear(will_appear(context, settings))
+    unread_counter.run_monitoring_cycle()
+    wait_for_animations(unread_counter)
+    backend.calls.clear()
+    sent.clear()
+    return list(KEY_SETTINGS)
+
+
+def wait_for_animations(unread_counter):
+    for data in unread_counter.context_data.values():
+        animation = getattr(data.tile_visualizer, "animation", None)
+        if animation is not None:
+            animation.thread.join()
+
+
+def run_night(unread_counter):
+    for _ in range(NIGHT_CYCLES):
+        unread_counter.run_monitoring_cycle()
+    wait_for_animations(unread_counter)
+
+
+def test_idle_visible_keys_send_nothing(unread_counter, backend, sent, shown_keys):
+    animations = {
+        context: data.tile_visualizer.animation
+        for context, data in unread_counter.context_data.items()
+        if isinstance(data.tile_visualizer, AnimatedExtraInfoVisualizer)
+    }
+
+    run_night(unread_counter)
+
+    # Without the deduplication every cycle sent a state and a title per key plus the animation frames
+    assert len(sent) == 0
+    assert sum(backend.calls.values()) == 0
+    for context, animation in animations.items():
+        assert unread_counter.context_data[context].tile_visualizer.animation is animation
+
+
+def test_disconnected_device_is_not_polled(unread_counter, backend, sent, shown_keys):
+    unread_counter.on_device_did_disconnect(device_did_disconnect())
+    unread_counter.run_monitoring_cycle()
+
+    assert not unread_counter.has_work()
+    assert unread_counter.folder_cache.folders == {}
+    backend.get_store(ACCOUNT).inbox.deliver("John", "Overnight")
+    run_night(unread_counter)
+
+    assert len(sent) == 0
+    assert sum(backend.calls.values()) == 0
+
+
+def test_hidden_keys_are_not_polled(unread_counter, backend, sent, shown_keys):
+    for context in shown_keys:
+        unread_counter.on_will_disappear(will_disappear(context))
+    unread_counter.run_monitoring_cycle()
+
+    assert not unread_counter.has_work()
+    run_night(unread_counter)
+
+    assert len(sent) == 0
+    assert sum(backend.calls.values()) == 0
+
+
+def test_wake_up_runs_one_coalesced_refresh(unread_counter, backend, sent, shown_keys):
+    unread_counter.on_device_did_disconnect(device_did_disconnect())
+    unread_counter.run_monitoring_cycle()
+    backend.get_store(ACCOUNT).inbox.deliver("John", "Overnight")
+
+    for _ in range(5):
+        unread_counter.on_system_did_wake_up(system_did_wake_up())
+    unread_counter.on_device_did_connect(device_did_connect())
+    assert unread_counter.wake_event.is_set()
+    unread_counter.wake_event.clear()
+    unread_counter.run_monitoring_cycle()
+    wait_for_animations(unread_counter)
+
+    # The Inbox is read once for all keys
+    assert backend.calls["GetTable"] == 1
+    final_titles = {context: title for context, title in sent.titles}
+    assert final_titles == {
+        "simple": "2",
+        "sender": "2\nJohn",
+        "animated": "2\nJohn\nOvernight",
+    }
+    assert {context for context, _ in sent.states} == set(shown_keys)
@@ -0,0 +1,126 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import ACCOUNT, will_appear
+from folder_cache import FolderCache
+from unread_index import UnreadFilter, UnreadIndex, UnreadItem
+
+BOSS_ADDRESS = "boss@example.com"
+
+
+def make_item(
+    sender: str = "Jane Doe", address: str = "jane@example.com", subject: str = "Hello"
+) -> UnreadItem:
+    return UnreadItem(
+        entry_id="entry", sender=sender, sender_address=address, subject=subject, received=datetime.now()
+    )
+
+
+@pytest.mark.parametrize(
+    "senders, subject_keywords, item, matches",
+    [
+        ("", "", make_item(), True),
+        ("jane", "", make_item(), True),
+        ("JANE@EXAMPLE.COM", "", make_item(sender="J. Doe"), True),
+        ("John; boss@example.com", "", make_item(), False),
+        ("", "[alert]", make_item(subject="[ALERT] Disk full"), True),
+        ("", "[alert]\nincident", make_item(subject="Weekly report"), False),
+        # Both filters have to match
+        ("jane", "alert", make_item(subject="Hello"), False),
+        ("jane", "alert", make_item(subject="Alert"), True),
+    ],
+)
+def test_filter_matches(senders, subject_keywords, item, matches):
+    assert UnreadFilter.from_settings(senders, subject_keywords).matches(item) is matches
+
+
+def test_seed_indexes_the_smtp_address_of_exchange_senders(backend):
+    inbox = backend.get_store(ACCOUNT).inbox
+    inbox.deliver("The Boss", "Review", address=BOSS_ADDRESS, exchange=True)
+    inbox.deliver("Jane Doe", "Hello")
+    inbox.deliver("Jane Doe", "Read").UnRead = False
+    index = UnreadIndex()
+
+    index.seed(inbox)
+
+    assert len(index) == 2
+    assert index.count(UnreadFilter.from_settings(BOSS_ADDRESS, None)) == 1
+    assert backend.calls["GetTable"] == 1
+    # The addresses come with the table, the items are not opened
+    assert backend.calls["GetProperty"] == 0
+
+
+@pytest.fixture
+def folder_cache(backend):
+    folder_cache = FolderCache(backend)
+    folder_cache.get_summary(backend.get_namespace(), ACCOUNT, (), UnreadFilter())
+    backend.calls.clear()
+    return folder_cache
+
+
+def get_count(folder_cache, backend, unread_filter: UnreadFilter = UnreadFilter()) -> int:
+    backend.pump_messages()
+    return folder_cache.get_summary(backend.get_namespace(), ACCOUNT, (), unread_filter).unread_count
+
+
+def test_events_update_the_index(folder_cache, backend):
+    inbox = backend.get_store(ACCOUNT).inbox
+
+    mail = inbox.deliver("Jane Doe", "Hello")
+    assert get_count(folder_cache, backend) == 1
+    boss_mail = inbox.deliver("The Boss", "Review", address=BOSS_ADDRESS, exchange=True)
+    assert get_count(folder_cache, backend, UnreadFilter.from_settings(BOSS_ADDRESS, None)) == 1
+    mail.UnRead = False
+    assert get_count(folder_cache, backend) == 1
+
+    # Only the Exchange sender's SMTP address was read, the folder was not read again
+    assert dict(backend.calls) == {"GetProperty": 1}
+    summary = folder_cache.get_summary(backend.get_namespace(), ACCOUNT, (), UnreadFilter())
+    assert summary.entry_id == boss_mail.EntryID
+
+
+def test_removed_items_are_verified_by_the_count(folder_cache, backend):
+    inbox = backend.get_store(ACCOUNT).inbox
+    read_mail = inbox.deliver("Jane Doe", "Read")
+    read_mail.UnRead = False
+    unread_mail = inbox.deliver("Jane Doe", "Unread")
+    assert get_count(folder_cache, backend) == 1
+    backend.calls.clear()
+
+    # Removing a read item does not change the count, the index stays
+    inbox.remove(read_mail)
+    assert get_count(folder_cache, backend) == 1
+    assert dict(backend.calls) == {"UnReadItemCount": 1}
+
+    # Removing an unread item makes the counts differ, the folder is read again
+    inbox.remove(unread_mail)
+    assert get_count(folder_cache, backend) == 0
+    assert backend.calls["UnReadItemCount"] == 2
+    assert backend.calls["GetTable"] == 1
+
+
+def test_filtered_keys_over_one_folder_are_counted_from_the_index(unread_counter, backend, sent):
+    inbox = backend.get_store(ACCOUNT).inbox
+    inbox.deliver("The Boss", "Review", address=BOSS_ADDRESS, exchange=True)
+    inbox.deliver("Monitor", "[ALERT] Disk full")
+    inbox.deliver("Jane Doe", "Lunch")
+    keys = {
+        "all": {},
+        "boss": {"filter_senders": BOSS_ADDRESS},
+        "alerts": {"filter_subject": "[alert]"},
+        "boss-alerts": {"filter_senders": "boss", "filter_subject": "[alert]"},
+    }
+    for context, settings in keys.items():
+        unread_counter.on_will_appear(will_appear(context, settings))
+    unread_counter.run_monitoring_cycle()
+    assert backend.calls["GetTable"] == 1
+    backend.calls.clear()
+    sent.clear()
+
+    inbox.deliver("Monitor", "[ALERT] CPU")
+    for _ in range(10):
+        unread_counter.run_monitoring_cycle()
+
+    assert sum(backend.calls.values()) == 0
+    assert {context: title for context, title in sent.titles} == {"all": "4", "alerts": "2"}